@@ -0,0 +1,84 @@
+"""스레드 풀 경로(기본)와 asyncio 네이티브 드라이버의 쿼리당 지연시간 비교
+
+    python -m bench.db_driver_bench
+        → 임시 SQLite 파일로 sqlite:/// 와 sqlite+aiosqlite:/// 비교
+    python -m bench.db_driver_bench --url postgresql://... --url postgresql+asyncpg://...
+        → 지정한 DATABASE_URL들을 차례로 비교 (같은 DB를 가리켜야 공정함)
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from urllib.parse import urlparse
+
+import db
+from bench.stats import summarize
+
+def _workload(ph):
+    """봇이 실제로 가장 많이 날리는 모양의 쿼리들"""
+    return {
+        "select_exp": (f"SELECT exp FROM bench_users WHERE user_id = {ph}", lambda i: (str(i % 100),), "one"),
+        "update_exp": (f"UPDATE bench_users SET exp = exp + {ph} WHERE user_id = {ph}", lambda i: (1, str(i % 100)), None),
+        "select_all": ("SELECT user_id, exp FROM bench_users ORDER BY exp DESC LIMIT 10", lambda i: (), "all"),
+    }
+
+async def _prepare(backend, ph):
+    await backend.execute("DROP TABLE IF EXISTS bench_users")
+    await backend.execute("CREATE TABLE bench_users (user_id TEXT PRIMARY KEY, exp INTEGER DEFAULT 0)")
+    for i in range(100):
+        await backend.execute(f"INSERT INTO bench_users (user_id, exp) VALUES ({ph}, 0)", (str(i),))
+
+async def _run_one(url, iterations, concurrency):
+    ph = "%s" if urlparse(url).scheme.startswith("postgres") else "?"
+    backend = db._make_backend(url)
+    results = {}
+    try:
+        await _prepare(backend, ph)
+        for name, (query, make_params, fetch) in _workload(ph).items():
+            # 순차: 쿼리 1개의 순수 지연시간
+            samples = []
+            for i in range(iterations):
+                started = time.perf_counter()
+                await backend.execute(query, make_params(i), fetch)
+                samples.append(time.perf_counter() - started)
+            results[f"{name}/sequential"] = summarize(samples)
+
+            # 동시: 음성 이벤트가 몰릴 때처럼 concurrency개를 한꺼번에
+            async def timed(i):
+                started = time.perf_counter()
+                await backend.execute(query, make_params(i), fetch)
+                return time.perf_counter() - started
+            samples = []
+            for start in range(0, iterations, concurrency):
+                samples += await asyncio.gather(*(timed(i) for i in range(start, min(start + concurrency, iterations))))
+            results[f"{name}/burst{concurrency}"] = summarize(samples)
+        await backend.execute("DROP TABLE IF EXISTS bench_users")
+    finally:
+        await backend.close()
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", help="비교할 DATABASE_URL (여러 번 지정 가능)")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = args.url or [f"sqlite:///{tmp}/bench.db", f"sqlite+aiosqlite:///{tmp}/bench.db"]
+        report = {}
+        for url in urls:
+            report[url] = await _run_one(url, args.iterations, args.concurrency)
+
+    for url, results in report.items():
+        print(f"\n▶ {url}")
+        for name, s in results.items():
+            print(f"  {name:<24} mean {s['mean_ms']:>8.3f}ms  p50 {s['p50_ms']:>8.3f}ms  p95 {s['p95_ms']:>8.3f}ms  p99 {s['p99_ms']:>8.3f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
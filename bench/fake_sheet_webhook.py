@@ -0,0 +1,35 @@
+"""GSHEET_WEBHOOK 대신 쓸 로컬 HTTP 서버 (SheetOutbox 동작 확인용)
+
+    python -m bench.fake_sheet_webhook --port 8765 --fail-rate 0.3
+    GSHEET_WEBHOOK=http://127.0.0.1:8765/ python main.py
+
+받은 요청을 시트별로 세어 출력하고, --fail-rate 비율만큼 500을 돌려줘 재시도를 확인할 수 있습니다.
+"""
+import argparse
+import random
+
+from aiohttp import web
+
+def make_app(fail_rate=0.0):
+    received = {}
+
+    async def handle(request):
+        if random.random() < fail_rate:
+            return web.Response(status=500, text="injected failure")
+        body = await request.json()
+        rows = body["rows"] if "rows" in body else [body["data"]]  # 묶음 / 기존 한 행 형태
+        received[body["sheet"]] = received.get(body["sheet"], 0) + len(rows)
+        print(f"[{body['sheet']}] +{len(rows)}행 (누적 {received[body['sheet']]}행)")
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app["received"] = received
+    app.router.add_post("/", handle)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.fail_rate), host="127.0.0.1", port=args.port)
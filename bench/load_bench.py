@@ -0,0 +1,374 @@
+"""가짜 Discord 객체로 main.py의 이벤트 핸들러에 합성 부하를 흘려 보내는 벤치마크
+
+    python -m bench.load_bench
+        → 임시 SQLite 파일에 유저 200명 × 90일 기록을 채운 뒤 2000개 작업 실행
+    python -m bench.load_bench --users 1000 --history-days 365 --operations 5000 --concurrency 20
+    python -m bench.load_bench --url sqlite+aiosqlite:///... --json result.json
+        → --url은 비어 있는 테스트용 DB만 지정할 것 (기록을 채우고 지우지 않음)
+
+핸들러별(on_voice_state_update, checkin, wakeup, on_interaction 버튼, slash_role_add_exp)과
+db.py 공개 함수별로 처리량과 p50/p95/p99를 출력하고, --json으로 같은 결과를 저장해서 실행끼리 비교.
+시트 전송과 메시지 수정 큐는 실제로 보내지 않음 (가짜 채널에 기록만 남김).
+"""
+import argparse
+import asyncio
+import functools
+import importlib
+import inspect
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pytz import timezone
+
+from bench.stats import summarize
+
+KST = timezone("Asia/Seoul")
+STUDY_CHANNEL_NAME = "📕｜공부기록"
+RANKING_BUTTONS = ("streak_rank", "total_rank", "weekly_study_rank", "monthly_wakeup_rank")
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 가짜 Discord 객체: 핸들러가 실제로 건드리는 속성/메서드만 흉내냄
+# ====================================================================================
+class _Ids:
+    def __init__(self, start):
+        self._next = start
+
+    def __call__(self):
+        self._next += 1
+        return self._next
+
+_message_ids = _Ids(9_000_000)
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        self.channel.edits += 1
+
+class FakeTextChannel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        return FakeMessage(self, _message_ids())
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id, name, guild=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+class FakeVoiceState:
+    def __init__(self, channel=None, self_video=False, self_stream=False):
+        self.channel = channel
+        self.self_video = self_video
+        self.self_stream = self_stream
+
+class FakeMember:
+    def __init__(self, member_id, guild):
+        import discord
+        self.id = member_id
+        self.guild = guild
+        self.display_name = f"공듀{member_id % 100000}"
+        self.mention = f"<@{member_id}>"
+        self.color = discord.Color.default()
+        self.display_avatar = FakeAsset()
+        self.avatar = FakeAsset()
+        self.bot = False
+        self.voice = None
+
+    async def move_to(self, channel):
+        self.voice = None
+
+class FakeGuild:
+    def __init__(self, guild_id, text_channels, voice_channels=()):
+        self.id = guild_id
+        self.text_channels = text_channels
+        self.voice_channels = list(voice_channels)
+        self.members = []
+        for channel in self.voice_channels:
+            channel.guild = self
+
+    def get_channel(self, channel_id):
+        return next((c for c in self.text_channels + self.voice_channels if c.id == channel_id), None)
+
+    def get_member(self, member_id):
+        return self._by_id.get(member_id)
+
+    def set_members(self, members):
+        self.members = members
+        self._by_id = {m.id: m for m in members}
+
+class FakeRole:
+    def __init__(self, name, members):
+        self.name = name
+        self.members = members
+
+class FakeContext:
+    def __init__(self, author, channel):
+        self.author = author
+        self.channel = channel
+        self.guild = author.guild
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+class FakeResponse:
+    async def send_message(self, content=None, **kwargs):
+        pass
+
+    async def defer(self, **kwargs):
+        pass
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        pass
+
+class FakeInteraction:
+    def __init__(self, user, custom_id=None):
+        self.user = user
+        self.guild = user.guild
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 측정: 핸들러는 호출마다, db.py 공개 코루틴 함수는 모듈 속성을 감싸서 기록
+# ====================================================================================
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[name].append(time.perf_counter() - started)
+        return timed
+
+    async def measure(self, name, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+_NOT_MEASURED = {"initialize_database", "run_migrations", "close_database"}
+
+def _instrument_db(db, recorder):
+    # main.py와 db.py 내부 호출이 모두 모듈 속성을 거치므로 여기서 바꿔 끼우면 전부 잡힘
+    for name, func in list(vars(db).items()):
+        if name.startswith("_") or name in _NOT_MEASURED:
+            continue
+        if inspect.iscoroutinefunction(func) and func.__module__ == db.__name__:
+            setattr(db, name, recorder.wrap(f"db.{name}", func))
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 과거 기록 채우기: 원본 테이블에 직접 넣고 집계/연속 기록은 기존 기록 기준으로 다시 계산
+# ====================================================================================
+async def _insert_rows(db, tx, table, columns, rows, chunk_size=200):
+    marks = f"({', '.join([db.placeholder] * len(columns))})"
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        await tx.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([marks] * len(chunk))}",
+            tuple(v for row in chunk for v in row)
+        )
+
+async def seed_history(db, members, history_days, rng):
+    today = datetime.now(KST).date()
+    users, attendance, wakeup, study = [], [], [], []
+    for member in members:
+        guild_id = str(member.guild.id)
+        user_id = str(member.id)
+        users.append((guild_id, user_id, member.display_name, rng.randint(0, 20000)))
+        diligence = rng.random()  # 유저마다 출석 빈도가 다름
+        for offset in range(1, history_days + 1):
+            day = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            if rng.random() < diligence:
+                attendance.append((guild_id, user_id, day))
+            if rng.random() < diligence * 0.6:
+                wakeup.append((guild_id, user_id, day))
+            if rng.random() < diligence * 0.8:
+                study.append((guild_id, user_id, day, rng.randint(5, 300)))
+    async with db.db_transaction() as tx:
+        await _insert_rows(db, tx, "users", ("guild_id", "user_id", "nickname", "exp"), users)
+        await _insert_rows(db, tx, "attendance", ("guild_id", "user_id", "date"), attendance)
+        await _insert_rows(db, tx, "wakeup", ("guild_id", "user_id", "date"), wakeup)
+        await _insert_rows(db, tx, "study", ("guild_id", "user_id", "date", "minutes"), study)
+    await db.rebuild_activity_rollups()
+    await db.rebuild_streaks()
+    return {"users": len(users), "attendance": len(attendance), "wakeup": len(wakeup), "study": len(study)}
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 작업 종류: 실제 서버에서 자주 일어나는 흐름을 핸들러 호출로 재현
+# ====================================================================================
+class Workload:
+    def __init__(self, main, recorder, guild, members, command_channel, rng, role_size):
+        self.main = main
+        self.recorder = recorder
+        self.guild = guild
+        self.members = members
+        self.command_channel = command_channel
+        self.rng = rng
+        self.role = FakeRole("벤치역할", members[:role_size])
+        self.library = next(c for c in guild.voice_channels if c.name == main.TRACKED_VOICE_CHANNELS[-2])
+        self.cam = next(c for c in guild.voice_channels if c.name == main.CAM_STUDY_CHANNEL)
+
+    async def voice(self, member, now):
+        # 실제 봇처럼 voice_dispatcher에 넣음 (on_voice_state_update는 지금 시각을 쓰므로
+        # 공부 시간이 0분이 되지 않게 입장 시각을 과거로 잡아 디스패처에 직접 제출)
+        dispatcher = self.main.voice_dispatcher
+        key = (member.guild.id, member.id)
+        joined = now - timedelta(minutes=self.rng.randint(5, 180))
+        channel = self.cam if self.rng.random() < 0.3 else self.library
+        started = time.perf_counter()
+        dispatcher.submit(key, member, FakeVoiceState(), FakeVoiceState(channel), joined)
+        if channel is self.cam:
+            dispatcher.submit(key, member, FakeVoiceState(channel), FakeVoiceState(channel, self_video=True),
+                              joined + timedelta(minutes=1))
+        dispatcher.submit(key, member, FakeVoiceState(channel), FakeVoiceState(), now)
+        await dispatcher.join(key)
+        self.recorder.samples["voice_dispatcher(제출→처리 완료)"].append(time.perf_counter() - started)
+
+    async def checkin(self, member, now):
+        await self.recorder.measure("checkin", self.main.checkin.callback(FakeContext(member, self.command_channel)))
+
+    async def wakeup(self, member, now):
+        await self.recorder.measure("wakeup", self.main.wakeup.callback(FakeContext(member, self.command_channel)))
+
+    async def ranking_button(self, member, now):
+        custom_id = self.rng.choice(RANKING_BUTTONS)
+        await self.recorder.measure(f"on_interaction[{custom_id}]",
+                                    self.main.on_interaction(FakeInteraction(member, custom_id)))
+
+    async def role_add_exp(self, member, now):
+        await self.recorder.measure("slash_role_add_exp",
+                                    self.main.slash_role_add_exp.callback(FakeInteraction(member), self.role, 10))
+
+    def mix(self):
+        # (작업, 가중치): 음성 입퇴장이 대부분이고 일괄 지급은 드묾
+        return [(self.voice, 50), (self.checkin, 20), (self.wakeup, 10), (self.ranking_button, 18), (self.role_add_exp, 2)]
+
+async def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        # db.py / main.py는 import 시점에 환경변수를 읽으므로 먼저 설정
+        os.environ["DATABASE_URL"] = args.url or f"sqlite:///{tmp}/load_bench.db"
+        os.environ.pop("DISCORD_TOKEN", None)
+        db = importlib.import_module("db")
+        main = importlib.import_module("main")
+
+        command_channel = FakeTextChannel(1, "💬｜명령어")
+        study_channel = FakeTextChannel(2, STUDY_CHANNEL_NAME)
+        channels = {
+            main.MYINFO_CHANNEL_ID: FakeTextChannel(main.MYINFO_CHANNEL_ID, "내정보"),
+            main.HONOR_CHANNEL_ID: FakeTextChannel(main.HONOR_CHANNEL_ID, "명예의전당"),
+            main.RANKING_CHANNEL_ID: FakeTextChannel(main.RANKING_CHANNEL_ID, "랭킹"),
+        }
+        voice_channels = [FakeVoiceChannel(20 + i, name) for i, name in enumerate(main.TRACKED_VOICE_CHANNELS)]
+        guild = FakeGuild(10, [command_channel, study_channel, *channels.values()], voice_channels)
+        members = [FakeMember(100_000 + i, guild) for i in range(args.users)]
+        guild.set_members(members)
+        main.bot.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+        main.GSHEET_WEBHOOK = "http://bench.invalid"  # 전송 작업은 시작하지 않으므로 메모리에 쌓이기만 함
+
+        await db.initialize_database()
+        await main.guild_configs.load()
+        await main.guild_configs.set(guild.id, **main.LEGACY_CHANNELS)
+        seeded = await seed_history(db, members, args.history_days, rng)
+        await db.load_leaderboard()
+        await db.load_study_sessions()
+
+        recorder = Recorder()
+        _instrument_db(db, recorder)
+        # 디스패처가 부르는 핸들러 자체의 시간은 따로 기록 (대기열에서 기다린 시간 제외)
+        main.voice_dispatcher.handler = recorder.wrap("on_voice_state_update", main.voice_dispatcher.handler)
+        workload = Workload(main, recorder, guild, members, command_channel, rng, args.role_size)
+        tasks, weights = zip(*workload.mix())
+        jobs = asyncio.Queue()
+        for _ in range(args.operations):
+            jobs.put_nowait((rng.choices(tasks, weights)[0], rng.choice(members)))
+
+        async def worker():
+            while not jobs.empty():
+                task, member = jobs.get_nowait()
+                try:
+                    await task(member, datetime.now(KST))
+                except Exception as e:
+                    recorder.samples[f"error[{type(e).__name__}]"].append(0.0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        # 메시지 수정 큐/예약 작업 등 뒤에 남은 백그라운드 작업 정리
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+        await db.close_database()
+
+    handlers = {k: v for k, v in recorder.samples.items() if not k.startswith("db.")}
+    db_calls = {k: v for k, v in recorder.samples.items() if k.startswith("db.")}
+    return {
+        "config": {"url": args.url or "sqlite (임시 파일)", "users": args.users, "history_days": args.history_days,
+                   "operations": args.operations, "concurrency": args.concurrency, "seed": args.seed},
+        "seeded": seeded,
+        "elapsed_sec": round(elapsed, 3),
+        "voice_dispatcher": main.voice_dispatcher.stats(),
+        "handlers": {k: summarize(v, elapsed) for k, v in sorted(handlers.items())},
+        "db": {k: summarize(v, elapsed) for k, v in sorted(db_calls.items())},
+    }
+
+def _print_section(title, results):
+    print(f"\n▶ {title}")
+    for name, s in results.items():
+        print(f"  {name:<40} n {s['count']:>6}  {s['per_sec']:>9.1f}/s  "
+              f"p50 {s['p50_ms']:>8.3f}ms  p95 {s['p95_ms']:>8.3f}ms  p99 {s['p99_ms']:>8.3f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="사용할 DATABASE_URL (기본: 임시 SQLite 파일)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--history-days", type=int, default=90)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--role-size", type=int, default=50, help="slash_role_add_exp 대상 역할 인원")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"기록: {report['seeded']}  /  {args.operations}개 작업 {report['elapsed_sec']}초")
+    _print_section("핸들러", report["handlers"])
+    print(f"  음성 이벤트 디스패처: {report['voice_dispatcher']}")
+    _print_section("db.py", report["db"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""벤치마크 스크립트들이 같이 쓰는 지연시간 요약"""
+import statistics
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples, elapsed=None):
+    """초 단위 샘플 → ms 단위 mean/p50/p95/p99 (elapsed를 주면 초당 처리량도)"""
+    ms = [s * 1000 for s in samples]
+    result = {
+        "count": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+    }
+    if elapsed:
+        result["per_sec"] = round(len(ms) / elapsed, 2)
+    return result
@@ -1,49 +1,872 @@
 import os
+import queue
+import re
 import sqlite3
+import functools
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pytz import timezone
 import asyncio
+import contextlib
 import psycopg2 # psycopg2 import 추가
 from urllib.parse import urlparse # urlparse import 추가
+from leaderboard import Leaderboard
+from result_cache import ResultCache
+import metrics
 
 # ... (DB 연결 설정은 기존과 동일)
 DATABASE_URL = os.getenv("DATABASE_URL")
-is_postgres = bool(DATABASE_URL)
-
-if is_postgres:
-    url = urlparse(DATABASE_URL)
-    def get_db_connection():
-        return psycopg2.connect(
-            dbname=url.path[1:], user=url.username,
-            password=url.password, host=url.hostname, port=url.port
-        )
-    placeholder = "%s"
-else:
-    def get_db_connection():
-        return sqlite3.connect("princess.db", check_same_thread=False)
-    placeholder = "?"
 
-async def db_execute(query, params=None, fetch=None):
-    def sync_db_call():
-        conn = None
+# 커넥션 풀 설정 (환경변수로 조정 가능)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))  # 등록 확인을 건너뛸 유저 수
+RANKING_CACHE_TTL = float(os.getenv("RANKING_CACHE_TTL", "60"))  # 출석 랭킹 버튼 결과를 재사용할 시간(초)
+MESSAGE_INDEX_CACHE_SIZE = int(os.getenv("MESSAGE_INDEX_CACHE_SIZE", "10000"))  # 메모리에 둘 (서버, kind, user_id) → 메시지 위치 수
+LEGACY_GUILD_ID = os.getenv("LEGACY_GUILD_ID", "")  # 여러 서버 지원 이전 기록이 속한 서버 ID (비워 두면 시작할 때 지정)
+
+# sqlite+wal 모드 설정
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))  # 연결당 페이지 캐시 (KiB)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL에서는 NORMAL도 커밋 단위로 안전
+SQLITE_MAX_BATCH = int(os.getenv("SQLITE_MAX_BATCH", "64"))  # 한 번에 커밋할 최대 쓰기 작업 수
+SQLITE_CHECKPOINT_INTERVAL = float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "60"))  # 초
+SQLITE_TX_STATEMENT_TIMEOUT = float(os.getenv("SQLITE_TX_STATEMENT_TIMEOUT", "5"))  # 트랜잭션 블록의 문장 사이 최대 대기(초)
+
+# DATABASE_URL 스킴으로 백엔드를 고릅니다.
+#   (미설정)                      SQLite princess.db, 스레드 풀
+#   sqlite:///경로                SQLite, 스레드 풀
+#   sqlite+wal:///경로            SQLite WAL, 쓰기 전용 스레드 1개(그룹 커밋) + 읽기 풀
+#   postgres://, postgresql://    psycopg2, 스레드 풀
+#   sqlite+aiosqlite:///경로      aiosqlite, asyncio 네이티브 (별도 설치)
+#   postgresql+asyncpg://...      asyncpg, asyncio 네이티브 (별도 설치)
+# 쿼리는 어느 모드든 placeholder(%s 또는 ?)로 작성하면 됩니다.
+_scheme = urlparse(DATABASE_URL).scheme if DATABASE_URL else "sqlite"
+is_postgres = _scheme.startswith("postgres")
+placeholder = "%s" if is_postgres else "?"
+
+# save_attendance 등이 중복 INSERT를 잡을 때 쓰는 예외 묶음 (드라이버별 예외는 로드 시 추가)
+IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 커넥션 풀: 쿼리마다 connect/close 하지 않고 연결을 재사용
+# ====================================================================================
+class _ConnectionPool:
+    """최대 max_size개의 연결을 재사용하는 풀 (psycopg2/sqlite3 공용, 전용 스레드에서 실행)"""
+
+    def __init__(self, connect, max_size, healthcheck_interval, connection_errors=()):
+        self._connect = connect
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        # 이 에러가 나면 연결 자체가 끊긴 것으로 보고 새 연결로 한 번 재시도
+        self._connection_errors = connection_errors
+        self._idle = deque()  # (conn, 마지막 사용 시각)
+        self._lock = threading.Lock()
+        # 대기는 이벤트 루프에서 하므로 DB 스레드는 절대 연결을 기다리며 막히지 않음
+        self._slots = asyncio.Semaphore(max_size)
+        # 풀 크기만큼의 전용 스레드가 연결을 소유하고 쿼리를 실행
+        self.executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+
+    def _is_healthy(self, conn):
+        if getattr(conn, "closed", 0):  # psycopg2는 끊긴 연결에 closed 값을 남김
+            return False
         try:
-            conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute(query, params or ())
-            if fetch == "one": result = cursor.fetchone()
-            elif fetch == "all": result = cursor.fetchall()
-            else: result = None
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        while True:
+            with self._lock:
+                conn, last_used = self._idle.pop() if self._idle else (None, 0)
+            if conn is None:
+                return self._connect()
+            # 오래 쉬었던 연결만 핑으로 확인 (매번 확인하면 왕복이 하나 더 생김)
+            if time.monotonic() - last_used < self.healthcheck_interval or self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def checkin(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def run(self, func):
+        """연결 하나를 빌려 func(conn)을 실행하고 반납 (DB 스레드 안에서 호출)"""
+        attempts = 2 if self._connection_errors else 1
+        for attempt in range(attempts):
+            conn = self.checkout()
+            try:
+                result = func(conn)
+            except self._connection_errors:
+                self.checkin(conn, broken=True)
+                if attempt + 1 < attempts:
+                    continue  # 끊긴 연결이면 새 연결로 재시도
+                raise
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    self.checkin(conn, broken=True)
+                    raise
+                self.checkin(conn)
+                raise
+            self.checkin(conn)
+            return result
+
+    async def submit(self, func):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.run, func)
+
+    async def execute(self, query, params=None, fetch=None):
+        def sync_db_call(conn):
+            result = _run_statement(conn, query, params, fetch)
             conn.commit()
             return result
+        return await self.submit(sync_db_call)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            tx = _ThreadedTransaction(self, await loop.run_in_executor(self.executor, self.checkout))
+            try:
+                yield tx
+                await loop.run_in_executor(self.executor, tx.conn.commit)
+            except BaseException:
+                try:
+                    await loop.run_in_executor(self.executor, tx.conn.rollback)
+                except Exception:
+                    self.checkin(tx.conn, broken=True)
+                    raise
+                self.checkin(tx.conn)
+                raise
+            self.checkin(tx.conn)
+
+    async def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+def _run_statement(conn, query, params, fetch):
+    cursor = conn.cursor()
+    cursor.execute(query, params or ())
+    if fetch == "one": return cursor.fetchone()
+    if fetch == "all": return cursor.fetchall()
+    return None
+
+class _ThreadedTransaction:
+    """트랜잭션 동안 연결 하나를 붙잡고, 문장마다 DB 스레드에서 실행"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self.conn = conn
+        self._first = True
+
+    def _run(self, query, params, fetch):
+        first, self._first = self._first, False
+        try:
+            return _run_statement(self.conn, query, params, fetch)
+        except self._pool._connection_errors:
+            if not first:
+                raise
+            # 첫 문장이면 아직 실행된 것이 없으므로 run()처럼 새 연결로 한 번 재시도
+            self._pool.checkin(self.conn, broken=True)
+            self.conn = self._pool.checkout()
+            return _run_statement(self.conn, query, params, fetch)
+
+    async def execute(self, query, params=None, fetch=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool.executor, self._run, query, params, fetch)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] asyncio 네이티브 드라이버 모드 (asyncpg / aiosqlite)
+# - 스레드 풀을 거치지 않고 이벤트 루프에서 바로 쿼리를 실행
+# ====================================================================================
+_PARAM_PATTERN = re.compile(r"%s")
+
+@functools.lru_cache(maxsize=512)
+def _to_dollar_params(query):
+    """%s placeholder를 asyncpg의 $1, $2 ... 형식으로 변환"""
+    counter = itertools.count(1)
+    return _PARAM_PATTERN.sub(lambda _: f"${next(counter)}", query)
+
+class _AsyncpgBackend:
+    def __init__(self, dsn, max_size):
+        global IntegrityError
+        import asyncpg
+        self._asyncpg = asyncpg
+        self._dsn = dsn
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        IntegrityError = IntegrityError + (asyncpg.IntegrityConstraintViolationError,)
+
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await self._asyncpg.create_pool(self._dsn, min_size=1, max_size=self.max_size)
+        return self._pool
+
+    async def execute(self, query, params=None, fetch=None):
+        return await _AsyncpgTransaction(await self._get_pool()).execute(query, params, fetch)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                yield _AsyncpgTransaction(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+class _AsyncpgTransaction:
+    """asyncpg 풀/연결 위에서 %s 쿼리를 그대로 실행 (풀에 직접 쓰면 문장 단위 autocommit)"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def execute(self, query, params=None, fetch=None):
+        query = _to_dollar_params(query)
+        args = params or ()
+        if fetch == "one": return await self._conn.fetchrow(query, *args)
+        if fetch == "all": return await self._conn.fetch(query, *args)
+        await self._conn.execute(query, *args)
+        return None
+
+class _AiosqliteBackend:
+    def __init__(self, path, max_size):
+        import aiosqlite
+        self._aiosqlite = aiosqlite
+        self._path = path
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_size)
+
+    async def execute(self, query, params=None, fetch=None):
+        async with self.transaction() as tx:
+            return await tx.execute(query, params, fetch)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._aiosqlite.connect(self._path)
+            try:
+                yield _AiosqliteTransaction(conn)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+            finally:
+                self._idle.append(conn)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+class _AiosqliteTransaction:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def execute(self, query, params=None, fetch=None):
+        async with self._conn.execute(query, params or ()) as cursor:
+            if fetch == "one": return await cursor.fetchone()
+            if fetch == "all": return await cursor.fetchall()
+            return None
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] SQLite 운영 모드 (sqlite+wal:///경로)
+# - WAL + synchronous/cache_size/mmap_size 조정
+# - 모든 쓰기는 전용 스레드 하나가 순서대로 실행 → "database is locked" 없음
+# - 큐에 쌓여 있던 쓰기 작업들은 BEGIN 한 번에 SAVEPOINT로 하나씩 실행하고 COMMIT 한 번 (그룹 커밋)
+#   각 작업의 결과는 COMMIT이 끝난 뒤에 돌려줌
+# - SELECT는 읽기 전용 연결 풀에서 실행 (WAL이라 쓰기와 동시에 읽을 수 있음)
+# - 쓰기가 없을 때 주기적으로 체크포인트
+# - db_transaction 블록이 실행되는 동안에는 쓰기 스레드가 그 블록의 다음 문장을 기다리므로
+#   SQLITE_TX_STATEMENT_TIMEOUT초 안에 다음 문장이 오지 않으면 블록을 롤백하고 다른 쓰기를 이어서 처리
+# ====================================================================================
+_COMMIT = object()
+_ROLLBACK = object()
+_STOP = object()
+
+def _sqlite_pragmas(conn, writer):
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if writer:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    else:
+        conn.execute("PRAGMA query_only = 1")
+
+def _resolve(future, result=None, error=None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def _deliver(loop, future, result=None, error=None):
+    try:
+        loop.call_soon_threadsafe(_resolve, future, result, error)
+    except RuntimeError:
+        pass  # 종료 중이라 이벤트 루프가 이미 닫힘
+
+def _run_and_close(conn, query, params, fetch):
+    # 커서를 닫아 두어야 RELEASE/COMMIT이 "SQL statements in progress"로 실패하지 않음
+    cursor = conn.execute(query, params or ())
+    try:
+        if fetch == "one": return cursor.fetchone()
+        if fetch == "all": return cursor.fetchall()
+        return None
+    finally:
+        cursor.close()
+
+class _WriteJob:
+    """문장 하나 (db_execute)"""
+
+    def __init__(self, loop, query, params, fetch):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.query, self.params, self.fetch = query, params, fetch
+
+class _WriteTransactionJob:
+    """db_transaction 블록 하나. 쓰기 스레드가 이 작업을 시작하면 블록이 끝날 때까지 이 작업의 문장만 실행"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.started = loop.create_future()
+        self.future = loop.create_future()
+        self.statements = queue.SimpleQueue()  # (query, params, fetch, future) 또는 _COMMIT/_ROLLBACK
+        # 시간 초과로 쓰기 스레드가 포기하면 그 예외를 남겨서, 이후 문장은 큐에 넣지 않고 바로 실패시킴
+        self.lock = threading.Lock()
+        self.aborted = None
+        # 블록이 예외로 끝나면 future를 기다리는 쪽이 없으므로 "never retrieved" 경고를 막음
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+class _SqliteWriter:
+    def __init__(self, path, max_batch, checkpoint_interval, statement_timeout):
+        self._path = path
+        self.max_batch = max_batch
+        self.checkpoint_interval = checkpoint_interval
+        self.statement_timeout = statement_timeout
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # 상태 확인용 카운터
+        self.commits = 0
+        self.jobs = 0
+
+    def submit(self, job):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+        self._jobs.put(job)
+
+    def _run(self):
+        conn = sqlite3.connect(self._path, isolation_level=None)  # BEGIN/COMMIT은 직접 관리
+        _sqlite_pragmas(conn, writer=True)
+        try:
+            while True:
+                try:
+                    job = self._jobs.get(timeout=self.checkpoint_interval)
+                except queue.Empty:
+                    self._checkpoint(conn)
+                    continue
+                if job is _STOP:
+                    return
+                batch = [job]
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is _STOP:
+                        self._jobs.put(_STOP)  # 이번 묶음을 커밋한 뒤 종료
+                        break
+                    batch.append(job)
+                try:
+                    self._commit_batch(conn, batch)
+                except Exception as e:
+                    # 쓰기 스레드가 죽으면 모든 쓰기가 멈추므로, 이번 묶음만 실패 처리하고 계속
+                    print(f"❌ SQLite 쓰기 묶음 처리 실패: {e}")
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    for job in batch:
+                        if isinstance(job, _WriteTransactionJob):
+                            _deliver(job.loop, job.started, error=e)
+                        _deliver(job.loop, job.future, error=e)
         finally:
-            if conn: conn.close()
-    return await asyncio.to_thread(sync_db_call)
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        done = []  # 커밋이 끝나야 돌려줄 (job, 결과)
+        conn.execute("BEGIN IMMEDIATE")
+        for job in batch:
+            conn.execute("SAVEPOINT job")
+            try:
+                if isinstance(job, _WriteTransactionJob):
+                    committed = self._run_transaction(conn, job)
+                    result = None
+                else:
+                    result = _run_and_close(conn, job.query, job.params, job.fetch)
+                    committed = True
+            except Exception as e:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                _deliver(job.loop, job.future, error=e)
+                continue
+            if committed:
+                conn.execute("RELEASE job")
+                done.append((job, result))
+            else:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                _deliver(job.loop, job.future)
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for job, _ in done:
+                _deliver(job.loop, job.future, error=e)
+            return
+        self.commits += 1
+        self.jobs += len(batch)
+        for job, result in done:
+            _deliver(job.loop, job.future, result)
+
+    def _run_transaction(self, conn, job):
+        """블록이 끝날 때까지 문장을 받아 실행. 커밋이면 True"""
+        _deliver(job.loop, job.started)
+        while True:
+            try:
+                item = job.statements.get(timeout=self.statement_timeout)
+            except queue.Empty:
+                # 블록 안에서 DB가 아닌 작업을 기다리느라 쓰기 스레드 전체가 멈추지 않도록 포기
+                error = TimeoutError(f"트랜잭션 블록이 {self.statement_timeout}초 동안 다음 문장을 보내지 않아 롤백했습니다.")
+                self._abort(job, error)
+                raise error
+            if item is _COMMIT:
+                return True
+            if item is _ROLLBACK:
+                return False
+            query, params, fetch, future = item
+            try:
+                _deliver(job.loop, future, _run_and_close(conn, query, params, fetch))
+            except Exception as e:
+                _deliver(job.loop, future, error=e)
+
+    def _abort(self, job, error):
+        with job.lock:
+            job.aborted = error
+            # 포기하기 직전에 들어온 문장도 실패로 돌려줌
+            while True:
+                try:
+                    item = job.statements.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    _deliver(job.loop, item[3], error=error)
+
+    def _checkpoint(self, conn):
+        try:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ WAL 체크포인트 실패: {e}")
+
+    async def close(self):
+        if self._thread is not None:
+            self._jobs.put(_STOP)
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+_LEADING_COMMENTS = re.compile(r"\s*(?:(?:--[^\n]*(?:\n|$)|/\*.*?\*/)\s*)*", re.S)
+_WRITE_KEYWORDS = re.compile(r"\b(?:INSERT|UPDATE|DELETE|REPLACE)\b", re.I)
+
+@functools.lru_cache(maxsize=1024)
+def _is_read_query(query):
+    """읽기 풀로 보내도 되는 문장인지 (앞쪽 주석은 건너뜀, PRAGMA 등은 쓰기 스레드로)"""
+    body = query[_LEADING_COMMENTS.match(query).end():]
+    keyword = body[:6].upper()
+    if keyword == "SELECT":
+        return True
+    if keyword[:4] == "WITH":
+        return not _WRITE_KEYWORDS.search(body)  # WITH ... INSERT 같은 CTE 쓰기는 제외
+    return False
+
+class _SqliteWalBackend:
+    def __init__(self, path, max_size):
+        self._writer = _SqliteWriter(path, SQLITE_MAX_BATCH, SQLITE_CHECKPOINT_INTERVAL, SQLITE_TX_STATEMENT_TIMEOUT)
+
+        def connect():
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _sqlite_pragmas(conn, writer=False)
+            return conn
+        self._readers = _ConnectionPool(connect, max_size, DB_HEALTHCHECK_INTERVAL)
+
+    async def execute(self, query, params=None, fetch=None):
+        if _is_read_query(query):
+            return await self._readers.execute(query, params, fetch)
+        job = _WriteJob(asyncio.get_running_loop(), query, params, fetch)
+        self._writer.submit(job)
+        return await job.future
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        job = _WriteTransactionJob(asyncio.get_running_loop())
+        self._writer.submit(job)
+        try:
+            await job.started
+            yield _SqliteWalTransaction(job)
+        except BaseException:
+            job.statements.put(_ROLLBACK)
+            raise
+        job.statements.put(_COMMIT)
+        await job.future
+
+    async def close(self):
+        await self._writer.close()
+        await self._readers.close()
+
+class _SqliteWalTransaction:
+    def __init__(self, job):
+        self._job = job
+
+    async def execute(self, query, params=None, fetch=None):
+        if query.strip().upper() == "BEGIN IMMEDIATE":
+            return None  # 쓰기 스레드가 이미 쓰기 잠금을 잡고 있음
+        future = self._job.loop.create_future()
+        with self._job.lock:
+            if self._job.aborted is not None:
+                raise self._job.aborted
+            self._job.statements.put((query, params, fetch, future))
+        return await future
+
+def _make_backend(database_url):
+    parsed = urlparse(database_url) if database_url else None
+    dialect, _, driver = (parsed.scheme if parsed else "sqlite").partition("+")
+    if dialect.startswith("postgres"):
+        if driver == "asyncpg":
+            return _AsyncpgBackend(parsed._replace(scheme="postgresql").geturl(), DB_POOL_SIZE)
+        if driver:
+            raise ValueError(f"지원하지 않는 PostgreSQL 드라이버입니다: {driver}")
+        def connect():
+            return psycopg2.connect(
+                dbname=parsed.path[1:], user=parsed.username,
+                password=parsed.password, host=parsed.hostname, port=parsed.port
+            )
+        return _ConnectionPool(connect, DB_POOL_SIZE, DB_HEALTHCHECK_INTERVAL,
+                               (psycopg2.OperationalError, psycopg2.InterfaceError))
+    if dialect != "sqlite":
+        raise ValueError(f"지원하지 않는 DATABASE_URL 스킴입니다: {parsed.scheme}")
+    path = (parsed.path[1:] if parsed else "") or "princess.db"
+    if driver == "aiosqlite":
+        return _AiosqliteBackend(path, DB_POOL_SIZE)
+    if driver == "wal":
+        return _SqliteWalBackend(path, DB_POOL_SIZE)
+    if driver:
+        raise ValueError(f"지원하지 않는 SQLite 드라이버입니다: {driver}")
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        # 풀의 다른 연결이 쓰는 중이면 바로 "database is locked"로 실패하지 않고 잠금이 풀릴 때까지 기다림
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+    return _ConnectionPool(connect, DB_POOL_SIZE, DB_HEALTHCHECK_INTERVAL)
+
+_backend = _make_backend(DATABASE_URL)
+
+# [신규] 계측이 켜져 있을 때만 쿼리 모양별 지연시간을 기록하는 버전을 씀 (꺼져 있으면 추가 비용 없음)
+if metrics.enabled:
+    class _TimedTransaction:
+        def __init__(self, tx):
+            self._tx = tx
+
+        async def execute(self, query, params=None, fetch=None):
+            started = time.perf_counter()
+            try:
+                return await self._tx.execute(query, params, fetch)
+            finally:
+                metrics.observe("db_query", metrics.query_shape(query), time.perf_counter() - started)
+
+    async def db_execute(query, params=None, fetch=None):
+        started = time.perf_counter()
+        try:
+            return await _backend.execute(query, params, fetch)
+        finally:
+            metrics.observe("db_query", metrics.query_shape(query), time.perf_counter() - started)
+
+    @contextlib.asynccontextmanager
+    async def db_transaction():
+        """문장마다 지연시간을 기록하는 db_transaction (사용법과 주의 사항은 아래 기본 버전과 같음)"""
+        async with _backend.transaction() as tx:
+            yield _TimedTransaction(tx)
+else:
+    async def db_execute(query, params=None, fetch=None):
+        return await _backend.execute(query, params, fetch)
+
+    def db_transaction():
+        """여러 문장을 한 트랜잭션으로 묶음. 블록이 예외로 끝나면 전부 롤백.
+
+            async with db.db_transaction() as tx:
+                await tx.execute(query, params)
+
+        블록 안에서는 tx.execute 말고 다른 것(Discord API, 시트 전송 등)을 await하지 말 것.
+        연결(sqlite+wal에서는 쓰기 스레드 전체)을 붙잡고 있으므로, sqlite+wal은
+        문장 사이가 SQLITE_TX_STATEMENT_TIMEOUT초를 넘으면 TimeoutError로 롤백함.
+        """
+        return _backend.transaction()
+
+async def close_database():
+    """풀에 남아 있는 연결을 모두 닫음 (종료 시/벤치마크용)"""
+    await _backend.close()
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 스키마 마이그레이션: 적용한 버전을 schema_version 테이블에 기록하고 새 버전만 실행
+# - 테이블 구조를 바꿀 때는 try/except ALTER 대신 _MIGRATIONS 끝에 다음 버전을 추가
+# - 버전마다 한 트랜잭션 (SQLite는 BEGIN IMMEDIATE, PostgreSQL은 테이블 잠금으로 동시 실행 방지)
+# ====================================================================================
+async def _migrate_session_multiplier(tx):
+    if is_postgres:
+        await tx.execute("ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS multiplier INTEGER DEFAULT 1")
+        return
+    columns = await tx.execute("PRAGMA table_info(study_sessions)", fetch="all")
+    if not any(column[1] == "multiplier" for column in columns):
+        await tx.execute("ALTER TABLE study_sessions ADD COLUMN multiplier INTEGER DEFAULT 1")
+
+async def _migrate_study_unique(tx):
+    # 동시에 퇴장하면서 생긴 (user_id, date) 중복 행을 합계 한 행으로 합친 뒤 유니크 키 추가
+    if await tx.execute("SELECT 1 FROM study GROUP BY user_id, date HAVING COUNT(*) > 1 LIMIT 1", fetch="one"):
+        await tx.execute("CREATE TEMPORARY TABLE study_merged AS SELECT user_id, date, SUM(minutes) AS minutes FROM study GROUP BY user_id, date")
+        await tx.execute("DELETE FROM study")
+        await tx.execute("INSERT INTO study (user_id, date, minutes) SELECT user_id, date, minutes FROM study_merged")
+        await tx.execute("DROP TABLE study_merged")
+    await tx.execute("CREATE UNIQUE INDEX IF NOT EXISTS study_user_date ON study (user_id, date)")
+
+async def _migrate_indexes(tx):
+    # 경험치 순위 (ORDER BY exp DESC, 순위 계산)
+    await tx.execute("CREATE INDEX IF NOT EXISTS users_exp ON users (exp DESC, user_id)")
+    # 유저별 조회는 (user_id, date) 유니크 키가 받고, 아래는 기간 단위로 여러 유저를 훑는 조회용
+    await tx.execute("CREATE INDEX IF NOT EXISTS attendance_date ON attendance (date, user_id)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS wakeup_date ON wakeup (date, user_id)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS study_date ON study (date, user_id, minutes)")
+
+async def _migrate_activity_rollups(tx):
+    await tx.execute("""
+    CREATE TABLE IF NOT EXISTS daily_activity (
+        user_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        attended INTEGER NOT NULL DEFAULT 0,
+        woke_up INTEGER NOT NULL DEFAULT 0,
+        study_minutes INTEGER NOT NULL DEFAULT 0,
+        exp_gained INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    )
+    """)
+    await tx.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_activity (
+        user_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        attended_days INTEGER NOT NULL DEFAULT 0,
+        wakeup_days INTEGER NOT NULL DEFAULT 0,
+        study_days INTEGER NOT NULL DEFAULT 0,
+        study_minutes INTEGER NOT NULL DEFAULT 0,
+        exp_gained INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month)
+    )
+    """)
+    await tx.execute("CREATE INDEX IF NOT EXISTS daily_activity_date ON daily_activity (date, user_id, study_minutes)")
+    await tx.execute("CREATE INDEX IF NOT EXISTS monthly_activity_month ON monthly_activity (month, user_id)")
+    # 기존 기록으로 채움 (과거 경험치 획득량은 기록이 없으므로 0)
+    await tx.execute("""
+    INSERT INTO daily_activity (user_id, date, attended, woke_up, study_minutes, exp_gained)
+    SELECT user_id, date, MAX(attended), MAX(woke_up), SUM(minutes), 0
+    FROM (
+        SELECT user_id, date, 1 AS attended, 0 AS woke_up, 0 AS minutes FROM attendance
+        UNION ALL SELECT user_id, date, 0, 1, 0 FROM wakeup
+        UNION ALL SELECT user_id, date, 0, 0, COALESCE(minutes, 0) FROM study
+    ) AS activity
+    GROUP BY user_id, date
+    """)
+    await tx.execute("""
+    INSERT INTO monthly_activity (user_id, month, attended_days, wakeup_days, study_days, study_minutes, exp_gained)
+    SELECT user_id, SUBSTR(date, 1, 7), SUM(attended), SUM(woke_up),
+           SUM(CASE WHEN study_minutes >= 10 THEN 1 ELSE 0 END), SUM(study_minutes), SUM(exp_gained)
+    FROM daily_activity
+    GROUP BY user_id, SUBSTR(date, 1, 7)
+    """)
+
+async def _migrate_bot_state(tx):
+    await tx.execute("CREATE TABLE IF NOT EXISTS bot_state (key TEXT PRIMARY KEY, value TEXT)")
+
+async def _migrate_message_index(tx):
+    await tx.execute("""
+    CREATE TABLE IF NOT EXISTS message_index (
+        kind TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        channel_id BIGINT,
+        message_id BIGINT NOT NULL,
+        PRIMARY KEY (kind, user_id)
+    )
+    """)
+    # bot_state에 있던 랭킹 메시지 ID를 옮김 (채널은 기록이 없어서 NULL = 기본 랭킹 채널)
+    await tx.execute("""
+    INSERT INTO message_index (kind, user_id, channel_id, message_id)
+    SELECT 'ranking', '', NULL, CAST(value AS BIGINT) FROM bot_state WHERE key = 'ranking_message_id'
+    """)
+    await tx.execute("DELETE FROM bot_state WHERE key = 'ranking_message_id'")
+
+# 여러 서버 지원: 유저 데이터 테이블을 guild_id가 앞에 붙은 키로 다시 만듦
+# (기본 키는 ALTER로 바꿀 수 없어서 새 테이블에 옮긴 뒤 이름을 바꿈, 인덱스도 guild_id부터)
+_GUILD_PARTITIONED_TABLES = [
+    ("users", "user_id TEXT NOT NULL, nickname TEXT, exp INTEGER DEFAULT 0, PRIMARY KEY (guild_id, user_id)",
+     "user_id, nickname, exp",
+     ["CREATE INDEX users_exp ON users (guild_id, exp DESC, user_id)"]),
+    ("attendance", "user_id TEXT NOT NULL, date TEXT NOT NULL, UNIQUE (guild_id, user_id, date)",
+     "user_id, date",
+     ["CREATE INDEX attendance_date ON attendance (guild_id, date, user_id)"]),
+    ("wakeup", "user_id TEXT NOT NULL, date TEXT NOT NULL, UNIQUE (guild_id, user_id, date)",
+     "user_id, date",
+     ["CREATE INDEX wakeup_date ON wakeup (guild_id, date, user_id)"]),
+    ("study", "user_id TEXT NOT NULL, date TEXT NOT NULL, minutes INTEGER",
+     "user_id, date, minutes",
+     ["CREATE UNIQUE INDEX study_user_date ON study (guild_id, user_id, date)",
+      "CREATE INDEX study_date ON study (guild_id, date, user_id, minutes)"]),
+    ("wakeup_pending", "user_id TEXT NOT NULL, message_id TEXT NOT NULL, PRIMARY KEY (guild_id, user_id)",
+     "user_id, message_id", []),
+    ("study_sessions", "user_id TEXT NOT NULL, start_time TEXT NOT NULL, message_id TEXT NOT NULL, multiplier INTEGER DEFAULT 1, PRIMARY KEY (guild_id, user_id)",
+     "user_id, start_time, message_id, multiplier", []),
+    ("streaks", "user_id TEXT NOT NULL, kind TEXT NOT NULL, current_streak INTEGER NOT NULL DEFAULT 0, longest_streak INTEGER NOT NULL DEFAULT 0, last_date TEXT, PRIMARY KEY (guild_id, user_id, kind)",
+     "user_id, kind, current_streak, longest_streak, last_date", []),
+    ("daily_activity", "user_id TEXT NOT NULL, date TEXT NOT NULL, attended INTEGER NOT NULL DEFAULT 0, woke_up INTEGER NOT NULL DEFAULT 0, study_minutes INTEGER NOT NULL DEFAULT 0, exp_gained INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (guild_id, user_id, date)",
+     "user_id, date, attended, woke_up, study_minutes, exp_gained",
+     ["CREATE INDEX daily_activity_date ON daily_activity (guild_id, date, user_id, study_minutes)"]),
+    ("monthly_activity", "user_id TEXT NOT NULL, month TEXT NOT NULL, attended_days INTEGER NOT NULL DEFAULT 0, wakeup_days INTEGER NOT NULL DEFAULT 0, study_days INTEGER NOT NULL DEFAULT 0, study_minutes INTEGER NOT NULL DEFAULT 0, exp_gained INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (guild_id, user_id, month)",
+     "user_id, month, attended_days, wakeup_days, study_days, study_minutes, exp_gained",
+     ["CREATE INDEX monthly_activity_month ON monthly_activity (guild_id, month, user_id)"]),
+    ("scheduled_jobs", "job_type TEXT NOT NULL, user_id TEXT NOT NULL, run_at DOUBLE PRECISION NOT NULL, payload TEXT, PRIMARY KEY (guild_id, job_type, user_id)",
+     "job_type, user_id, run_at, payload", []),
+    ("message_index", "kind TEXT NOT NULL, user_id TEXT NOT NULL, channel_id BIGINT, message_id BIGINT NOT NULL, PRIMARY KEY (guild_id, kind, user_id)",
+     "kind, user_id, channel_id, message_id", []),
+]
+
+async def _migrate_guild_partition(tx):
+    # 이전 기록이 어느 서버 것인지는 LEGACY_GUILD_ID로 받고, 없으면 ''로 두었다가 assign_legacy_guild에서 지정
+    for table, columns, copied, indexes in _GUILD_PARTITIONED_TABLES:
+        await tx.execute(f"CREATE TABLE {table}_new (guild_id TEXT NOT NULL, {columns})")
+        await tx.execute(
+            f"INSERT INTO {table}_new (guild_id, {copied}) SELECT CAST({placeholder} AS TEXT), {copied} FROM {table}",
+            (LEGACY_GUILD_ID,)
+        )
+        await tx.execute(f"DROP TABLE {table}")
+        await tx.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for index in indexes:
+            await tx.execute(index)
+    await tx.execute("""
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id TEXT PRIMARY KEY,
+        ranking_channel_id BIGINT,
+        honor_channel_id BIGINT,
+        myinfo_channel_id BIGINT,
+        attendance_channel_id BIGINT,
+        wakeup_channel_id BIGINT,
+        study_log_channel_id BIGINT,
+        tracked_voice_channel_ids TEXT
+    )
+    """)
+
+async def _migrate_cam_study_channel(tx):
+    # 캠스터디(카메라 필수) 음성 채널도 서버마다 지정 (NULL이면 기본 이름으로 찾음)
+    await tx.execute("ALTER TABLE guild_config ADD COLUMN cam_study_channel_id BIGINT")
+
+_MIGRATIONS = [
+    (1, "study_sessions.multiplier 컬럼", _migrate_session_multiplier),
+    (2, "study 중복 정리 + (user_id, date) 유니크 키", _migrate_study_unique),
+    (3, "조회용 인덱스", _migrate_indexes),
+    (4, "daily_activity / monthly_activity 집계 테이블", _migrate_activity_rollups),
+    (5, "bot_state (재시작 후에도 유지할 값)", _migrate_bot_state),
+    (6, "message_index (내정보/랭킹 메시지 위치)", _migrate_message_index),
+    (7, "서버(guild_id)별 데이터 분리 + guild_config", _migrate_guild_partition),
+    (8, "guild_config.cam_study_channel_id 컬럼", _migrate_cam_study_channel),
+]
+LATEST_SCHEMA_VERSION = _MIGRATIONS[-1][0]
+
+async def get_schema_version() -> int:
+    """적용된 마지막 버전 (schema_version 테이블이 아직 없으면 0)"""
+    try:
+        row = await db_execute("SELECT MAX(version) FROM schema_version", fetch="one")
+    except Exception:
+        return 0
+    return row[0] or 0
+
+async def run_migrations():
+    await db_execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at DOUBLE PRECISION NOT NULL
+    )
+    """)
+    current = await get_schema_version()
+    for version, description, migrate in _MIGRATIONS:
+        if version <= current:
+            continue
+        async with db_transaction() as tx:
+            if is_postgres:
+                await tx.execute("LOCK TABLE schema_version IN EXCLUSIVE MODE")
+            else:
+                await tx.execute("BEGIN IMMEDIATE")
+            # 잠금을 잡은 뒤 다시 확인 (다른 프로세스가 먼저 적용했을 수 있음)
+            if await tx.execute(f"SELECT 1 FROM schema_version WHERE version = {placeholder}", (version,), fetch="one"):
+                continue
+            await migrate(tx)
+            await tx.execute(
+                f"INSERT INTO schema_version (version, description, applied_at) VALUES ({placeholder}, {placeholder}, {placeholder})",
+                (version, description, time.time())
+            )
+        print(f"✅ 스키마 마이그레이션 {version} 적용: {description}")
 
 # ====================================================================================
 # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
 # [수정] study_sessions 테이블에 multiplier 컬럼 추가
 # ====================================================================================
 async def initialize_database():
+    # [수정] 이미 최신 버전이면 쿼리 한 번으로 끝 (재시작마다 CREATE TABLE을 다시 보내지 않음)
+    # 그래서 아래 CREATE TABLE 목록은 더 늘리지 말고, 새 테이블은 _MIGRATIONS에 추가
+    if await get_schema_version() >= LATEST_SCHEMA_VERSION:
+        return
     # ... (users, attendance, wakeup, study, wakeup_pending 테이블은 기존과 동일)
     await db_execute("""CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, nickname TEXT, exp INTEGER DEFAULT 0)""")
     await db_execute("""CREATE TABLE IF NOT EXISTS attendance (user_id TEXT, date TEXT, UNIQUE(user_id, date))""")
@@ -60,223 +883,974 @@ async def initialize_database():
         multiplier INTEGER DEFAULT 1 
     )
     """)
-    # (SQLite 한정) 이미 테이블이 있을 경우, 컬럼만 추가
-    if not is_postgres:
-        try:
-            await db_execute("ALTER TABLE study_sessions ADD COLUMN multiplier INTEGER DEFAULT 1")
-        except sqlite3.OperationalError:
-            pass # 이미 컬럼이 존재하면 에러가 나므로 무시
+    # 이미 테이블이 있을 때 컬럼 추가 등은 run_migrations()에서 처리
+
+    # [신규] 유저별 연속 기록 카운터 (kind: attendance / wakeup / study)
+    await db_execute("""
+    CREATE TABLE IF NOT EXISTS streaks (
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        last_date TEXT,
+        PRIMARY KEY (user_id, kind)
+    )
+    """)
+    # [신규] 구글 시트 전송 대기열 (재시작해도 보내지 못한 행이 남음)
+    await db_execute(f"""
+    CREATE TABLE IF NOT EXISTS sheet_outbox (
+        id {"SERIAL PRIMARY KEY" if is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"},
+        sheet TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at DOUBLE PRECISION NOT NULL
+    )
+    """)
+    # [신규] 예약 작업 (캠스터디 강퇴 등, 재시작해도 유지)
+    await db_execute("""
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        job_type TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        run_at DOUBLE PRECISION NOT NULL,
+        payload TEXT,
+        PRIMARY KEY (job_type, user_id)
+    )
+    """)
+    await run_migrations()
+    # 카운터가 비어 있으면 기존 기록으로 한 번 채움
+    if not await db_execute("SELECT 1 FROM streaks LIMIT 1", fetch="one"):
+        await rebuild_streaks()
+    # 일별/월별 집계도 비어 있는데 원본 기록이 있으면 한 번 채움
+    if (not await db_execute("SELECT 1 FROM daily_activity LIMIT 1", fetch="one")
+            and await db_execute("SELECT 1 FROM attendance UNION ALL SELECT 1 FROM study LIMIT 1", fetch="one")):
+        await rebuild_activity_rollups()
 
     print("✅ 데이터베이스 테이블 초기화 완료")
 
-# ... (_register_user, save_attendance, get_attendance 등 다른 함수는 기존과 동일)
-async def _register_user(user_id: str, nickname: str):
-    if is_postgres:
-        query = f"""
-        INSERT INTO users (user_id, nickname, exp) VALUES ({placeholder}, {placeholder}, 0)
-        ON CONFLICT (user_id) DO UPDATE SET nickname = {placeholder};
-        """
-        await db_execute(query, (user_id, nickname, nickname))
-    else:
-        user = await db_execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,), fetch="one")
-        if not user:
-            await db_execute("INSERT INTO users (user_id, nickname, exp) VALUES (?, ?, 0)", (user_id, nickname))
-        else:
-            await db_execute("UPDATE users SET nickname = ? WHERE user_id = ?", (nickname, user_id))
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 여러 서버 지원: 유저 데이터는 모두 (guild_id, user_id) 기준
+# - 마이그레이션 7 이전 기록은 guild_id = '' 로 옮겨져 있다가 assign_legacy_guild로 한 번 지정
+# - 서버별 채널 설정은 guild_config 테이블 (main.py의 GuildConfigCache가 메모리에 올려서 사용)
+# ====================================================================================
+# 이전 기록을 옮길 때 guild_id에 이미 같은 키의 행이 있으면: (충돌 키, 합칠 방법 또는 None = 지금 값 유지)
+_GREATEST = "GREATEST" if is_postgres else "MAX"  # SQLite는 인자가 여러 개인 MAX가 GREATEST 역할
+_LEGACY_MERGE = {
+    "users": ("guild_id, user_id", "exp = users.exp + EXCLUDED.exp"),
+    "attendance": ("guild_id, user_id, date", None),
+    "wakeup": ("guild_id, user_id, date", None),
+    "study": ("guild_id, user_id, date", "minutes = COALESCE(study.minutes, 0) + COALESCE(EXCLUDED.minutes, 0)"),
+    "wakeup_pending": ("guild_id, user_id", None),
+    "study_sessions": ("guild_id, user_id", None),
+    "streaks": ("guild_id, user_id, kind", None),  # 옮긴 뒤 rebuild_streaks로 다시 계산
+    "daily_activity": ("guild_id, user_id, date",
+                       f"attended = {_GREATEST}(daily_activity.attended, EXCLUDED.attended), "
+                       f"woke_up = {_GREATEST}(daily_activity.woke_up, EXCLUDED.woke_up), "
+                       "study_minutes = daily_activity.study_minutes + EXCLUDED.study_minutes, "
+                       "exp_gained = daily_activity.exp_gained + EXCLUDED.exp_gained"),
+    "monthly_activity": ("guild_id, user_id, month",
+                         "attended_days = monthly_activity.attended_days + EXCLUDED.attended_days, "
+                         "wakeup_days = monthly_activity.wakeup_days + EXCLUDED.wakeup_days, "
+                         "study_days = monthly_activity.study_days + EXCLUDED.study_days, "
+                         "study_minutes = monthly_activity.study_minutes + EXCLUDED.study_minutes, "
+                         "exp_gained = monthly_activity.exp_gained + EXCLUDED.exp_gained"),
+    "scheduled_jobs": ("guild_id, job_type, user_id", None),
+    "message_index": ("guild_id, kind, user_id", None),
+}
+
+async def assign_legacy_guild(guild_id: str) -> int:
+    """서버가 정해지지 않은 이전 기록을 guild_id로 옮기고 옮긴 행 수를 반환
+
+    LEGACY_GUILD_ID를 나중에 설정해서 그 서버에 이미 기록이 있어도 키가 겹치지 않도록
+    UPDATE 대신 INSERT ... SELECT ... ON CONFLICT로 합친 뒤 빈 guild_id 행을 지움
+    """
+    moved = 0
+    async with db_transaction() as tx:
+        for table, _, copied, _ in _GUILD_PARTITIONED_TABLES:
+            count = (await tx.execute(f"SELECT COUNT(*) FROM {table} WHERE guild_id = ''", fetch="one"))[0]
+            if not count:
+                continue
+            conflict, merge = _LEGACY_MERGE[table]
+            action = f"DO UPDATE SET {merge}" if merge else "DO NOTHING"
+            await tx.execute(f"""
+            INSERT INTO {table} (guild_id, {copied})
+            SELECT {placeholder}, {copied} FROM {table} WHERE guild_id = ''
+            ON CONFLICT ({conflict}) {action}
+            """, (guild_id,))
+            await tx.execute(f"DELETE FROM {table} WHERE guild_id = ''")
+            moved += count
+    if moved:
+        await rebuild_streaks(guild_id)
+    return moved
+
+async def count_unassigned_rows() -> int:
+    """아직 서버가 정해지지 않은 (guild_id = '') 행 수"""
+    total = 0
+    for table, _, _, _ in _GUILD_PARTITIONED_TABLES:
+        total += (await db_execute(f"SELECT COUNT(*) FROM {table} WHERE guild_id = ''", fetch="one"))[0]
+    return total
+
+GUILD_CONFIG_COLUMNS = (
+    "ranking_channel_id", "honor_channel_id", "myinfo_channel_id", "attendance_channel_id",
+    "wakeup_channel_id", "study_log_channel_id", "cam_study_channel_id", "tracked_voice_channel_ids",
+)
+
+async def get_guild_configs():
+    """{guild_id: {컬럼: 값, ...}, ...}"""
+    rows = await db_execute(f"SELECT guild_id, {', '.join(GUILD_CONFIG_COLUMNS)} FROM guild_config", fetch="all")
+    return {row[0]: dict(zip(GUILD_CONFIG_COLUMNS, row[1:])) for row in rows}
+
+async def set_guild_config(guild_id: str, **values):
+    """guild_config의 일부 컬럼만 저장 (없던 서버면 행을 만듦)"""
+    unknown = set(values) - set(GUILD_CONFIG_COLUMNS)
+    if unknown:
+        raise ValueError(f"알 수 없는 서버 설정: {', '.join(sorted(unknown))}")
+    columns = list(values)
+    marks = ", ".join([placeholder] * (len(columns) + 1))
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns)
+    query = f"""
+    INSERT INTO guild_config (guild_id, {', '.join(columns)}) VALUES ({marks})
+    ON CONFLICT (guild_id) DO UPDATE SET {updates}
+    """
+    await db_execute(query, (guild_id, *values.values()))
 
-async def save_attendance(user_id: str, nickname: str) -> bool:
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 유저 등록: 이미 같은 닉네임으로 등록된 유저는 DB에 다시 쓰지 않음
+# - ((guild_id, user_id) → nickname) LRU 캐시, 닉네임이 바뀌면 forget_user로 무효화
+# ====================================================================================
+_known_users = OrderedDict()
+
+def _remember_user(guild_id: str, user_id: str, nickname: str):
+    key = (guild_id, user_id)
+    _known_users[key] = nickname
+    _known_users.move_to_end(key)
+    while len(_known_users) > USER_CACHE_SIZE:
+        _known_users.popitem(last=False)
+
+def forget_user(user_id: str, guild_id: str = None):
+    """캐시에서 제거해서 다음 기록 때 닉네임을 DB에 다시 반영하게 함 (guild_id가 없으면 모든 서버)"""
+    if guild_id is not None:
+        _known_users.pop((guild_id, user_id), None)
+        return
+    for key in [key for key in _known_users if key[1] == user_id]:
+        del _known_users[key]
+
+async def _register_user(guild_id: str, user_id: str, nickname: str):
+    if _known_users.get((guild_id, user_id)) == nickname:
+        _known_users.move_to_end((guild_id, user_id))
+        return
+    query = f"""
+    INSERT INTO users (guild_id, user_id, nickname, exp) VALUES ({placeholder}, {placeholder}, {placeholder}, 0)
+    ON CONFLICT (guild_id, user_id) DO UPDATE SET nickname = EXCLUDED.nickname
+    """
+    await db_execute(query, (guild_id, user_id, nickname))
+    _remember_user(guild_id, user_id, nickname)
+    board = _leaderboard(guild_id)
+    if board is not None:
+        board.touch(user_id, nickname)
+
+async def save_attendance(guild_id: str, user_id: str, nickname: str) -> bool:
     today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
-    await _register_user(user_id, nickname)
+    await _register_user(guild_id, user_id, nickname)
     try:
-        await db_execute(f"INSERT INTO attendance (user_id, date) VALUES ({placeholder}, {placeholder})", (user_id, today))
-        return True
-    except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+        async with db_transaction() as tx:
+            await tx.execute(f"INSERT INTO attendance (guild_id, user_id, date) VALUES ({placeholder}, {placeholder}, {placeholder})", (guild_id, user_id, today))
+            await _bump_streak(tx, guild_id, user_id, "attendance", today)
+            await _bump_user_activity(tx, guild_id, user_id, today, attended=1)
+    except IntegrityError:
         return False
+    get_ranking_cache(guild_id).invalidate()
+    return True
 
-async def get_attendance(user_id: str):
-    return await db_execute(f"SELECT date FROM attendance WHERE user_id = {placeholder} ORDER BY date DESC", (user_id,), fetch="all")
+async def get_attendance(guild_id: str, user_id: str):
+    return await db_execute(
+        f"SELECT date FROM attendance WHERE guild_id = {placeholder} AND user_id = {placeholder} ORDER BY date DESC",
+        (guild_id, user_id), fetch="all"
+    )
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 기록 페이지 조회: 전체 기록을 읽지 않고 (guild_id, user_id, date) 유니크 인덱스로 한 페이지씩
+# - 커서는 이전 페이지의 마지막 날짜 (OFFSET 없이 date < 커서로 이어서 읽음)
+# - 개수는 같은 인덱스만 훑는 COUNT(*)
+# ====================================================================================
+HISTORY_PAGE_SIZE = 20
+_HISTORY_COLUMNS = {
+    "attendance": "date",
+    "wakeup": "date",
+    "study": "date, minutes",
+}
+
+async def get_history_page(guild_id: str, kind: str, user_id: str, before: str = None, limit: int = HISTORY_PAGE_SIZE):
+    """최신순 한 페이지와 다음 페이지 커서를 (rows, next_before)로 반환 (마지막 페이지면 next_before는 None)"""
+    if kind not in _HISTORY_COLUMNS:
+        raise ValueError(f"알 수 없는 기록 종류: {kind}")
+    columns = _HISTORY_COLUMNS[kind]
+    if before is None:
+        query = f"SELECT {columns} FROM {kind} WHERE guild_id = {placeholder} AND user_id = {placeholder} ORDER BY date DESC LIMIT {placeholder}"
+        params = (guild_id, user_id, limit + 1)
+    else:
+        query = f"SELECT {columns} FROM {kind} WHERE guild_id = {placeholder} AND user_id = {placeholder} AND date < {placeholder} ORDER BY date DESC LIMIT {placeholder}"
+        params = (guild_id, user_id, before, limit + 1)
+    rows = await db_execute(query, params, fetch="all") or []
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][0]
+    return rows, None
+
+async def count_history(guild_id: str, kind: str, user_id: str) -> int:
+    if kind not in _HISTORY_COLUMNS:
+        raise ValueError(f"알 수 없는 기록 종류: {kind}")
+    row = await db_execute(
+        f"SELECT COUNT(*) FROM {kind} WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (guild_id, user_id), fetch="one"
+    )
+    return row[0] if row else 0
 
-async def save_wakeup(user_id: str, nickname: str) -> bool:
+async def save_wakeup(guild_id: str, user_id: str, nickname: str) -> bool:
     today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
-    await _register_user(user_id, nickname)
+    await _register_user(guild_id, user_id, nickname)
     try:
-        await db_execute(f"INSERT INTO wakeup (user_id, date) VALUES ({placeholder}, {placeholder})", (user_id, today))
+        async with db_transaction() as tx:
+            await tx.execute(f"INSERT INTO wakeup (guild_id, user_id, date) VALUES ({placeholder}, {placeholder}, {placeholder})", (guild_id, user_id, today))
+            await _bump_streak(tx, guild_id, user_id, "wakeup", today)
+            await _bump_user_activity(tx, guild_id, user_id, today, woke_up=1)
         return True
-    except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+    except IntegrityError:
         return False
 
-async def log_study_time(user_id: str, nickname: str, minutes: int):
+async def log_study_time(guild_id: str, user_id: str, nickname: str, minutes: int):
     today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
-    await _register_user(user_id, nickname)
-    row = await db_execute(f"SELECT minutes FROM study WHERE user_id = {placeholder} AND date = {placeholder}", (user_id, today), fetch="one")
-    if row:
-        total = row[0] + minutes
-        await db_execute(f"UPDATE study SET minutes = {placeholder} WHERE user_id = {placeholder} AND date = {placeholder}", (total, user_id, today))
-    else:
-        await db_execute(f"INSERT INTO study (user_id, date, minutes) VALUES ({placeholder}, {placeholder}, {placeholder})", (user_id, today, minutes))
+    await _register_user(guild_id, user_id, nickname)
+    # (guild_id, user_id, date) 유니크 키 덕분에 문장 하나로 누적
+    query = f"""
+    INSERT INTO study (guild_id, user_id, date, minutes) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT (guild_id, user_id, date) DO UPDATE SET minutes = study.minutes + EXCLUDED.minutes
+    """
+    params = (guild_id, user_id, today, minutes)
+    async with db_transaction() as tx:
+        if _has_returning:
+            total = (await tx.execute(query + " RETURNING minutes", params, fetch="one"))[0]
+        else:
+            await tx.execute(query, params)
+            total = (await tx.execute(
+                f"SELECT minutes FROM study WHERE guild_id = {placeholder} AND user_id = {placeholder} AND date = {placeholder}",
+                (guild_id, user_id, today), fetch="one"
+            ))[0]
+        # 하루 10분 이상이면 공부 연속 기록 인정 (같은 날 여러 번 올려도 한 번만 증가)
+        if total >= 10:
+            await _bump_streak(tx, guild_id, user_id, "study", today)
+        await _bump_user_activity(tx, guild_id, user_id, today, study_minutes=minutes,
+                                  study_day=1 if total >= 10 > total - minutes else 0)
 
-async def get_today_study_time(user_id: str) -> int:
+async def get_today_study_time(guild_id: str, user_id: str) -> int:
     today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
-    row = await db_execute(f"SELECT minutes FROM study WHERE user_id = {placeholder} AND date = {placeholder}", (user_id, today), fetch="one")
+    row = await db_execute(
+        f"SELECT minutes FROM study WHERE guild_id = {placeholder} AND user_id = {placeholder} AND date = {placeholder}",
+        (guild_id, user_id, today), fetch="one"
+    )
     return row[0] if row else 0
 
-async def add_exp(user_id: str, nickname: str, amount: int):
-    await _register_user(user_id, nickname)
-    await db_execute(f"UPDATE users SET exp = exp + {placeholder} WHERE user_id = {placeholder}", (amount, user_id))
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 경험치 변경: 유저 등록 + 증감을 문장 하나로 처리하고 (이전 값, 이후 값)을 반환
+# - 동시에 여러 번 지급돼도 DB가 원자적으로 더하므로 값이 꼬이지 않음
+# ====================================================================================
+# RETURNING은 PostgreSQL과 SQLite 3.35.0+ 에서만 지원됩니다.
+_has_returning = is_postgres or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_GRANT_EXP_QUERY = f"""
+INSERT INTO users (guild_id, user_id, nickname, exp) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+ON CONFLICT (guild_id, user_id) DO UPDATE SET nickname = EXCLUDED.nickname, exp = users.exp + EXCLUDED.exp
+"""
+
+async def grant_exp(guild_id: str, user_id: str, nickname: str, amount: int):
+    """경험치 amount(양수)를 더하고 (이전 exp, 이후 exp)를 반환. 처음 보는 유저는 등록"""
+    params = (guild_id, user_id, nickname, amount)
+    today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
+    async with db_transaction() as tx:
+        if _has_returning:
+            exp_after = (await tx.execute(_GRANT_EXP_QUERY + " RETURNING exp", params, fetch="one"))[0]
+        else:
+            await tx.execute(_GRANT_EXP_QUERY, params)
+            exp_after = (await tx.execute(
+                f"SELECT exp FROM users WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+                (guild_id, user_id), fetch="one"
+            ))[0]
+        await _bump_user_activity(tx, guild_id, user_id, today, exp_gained=amount)
+    _remember_user(guild_id, user_id, nickname)
+    board = _leaderboard(guild_id)
+    if board is not None:
+        # 동시 지급의 결과가 어떤 순서로 돌아와도 맞도록 최종값 대신 증감분을 반영
+        board.add(user_id, amount, nickname)
+    return exp_after - amount, exp_after
+
+async def add_exp(guild_id: str, user_id: str, nickname: str, amount: int):
+    await grant_exp(guild_id, user_id, nickname, amount)
+
+# SQLite 구버전의 바인딩 변수 999개 제한 안쪽으로 (행당 변수 4개)
+_BULK_CHUNK_SIZE = 200
+
+async def grant_exp_bulk(guild_id: str, grants):
+    """한 서버의 [(user_id, nickname, amount), ...]를 한 트랜잭션에서 지급하고 [(user_id, 이전 exp, 이후 exp), ...] 반환"""
+    totals = OrderedDict()  # 같은 유저가 여러 번 있으면 합쳐서 한 행으로
+    for user_id, nickname, amount in grants:
+        _, total = totals.get(user_id, (nickname, 0))
+        totals[user_id] = (nickname, total + amount)
+    items = list(totals.items())
+    exp_after = {}
+    today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
+    async with db_transaction() as tx:
+        for start in range(0, len(items), _BULK_CHUNK_SIZE):
+            chunk = items[start:start + _BULK_CHUNK_SIZE]
+            values = ", ".join([f"({placeholder}, {placeholder}, {placeholder}, {placeholder})"] * len(chunk))
+            params = tuple(v for user_id, (nickname, amount) in chunk for v in (guild_id, user_id, nickname, amount))
+            query = f"""
+            INSERT INTO users (guild_id, user_id, nickname, exp) VALUES {values}
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET nickname = EXCLUDED.nickname, exp = users.exp + EXCLUDED.exp
+            """
+            if _has_returning:
+                rows = await tx.execute(query + " RETURNING user_id, exp", params, fetch="all")
+            else:
+                await tx.execute(query, params)
+                marks = ", ".join([placeholder] * len(chunk))
+                rows = await tx.execute(f"SELECT user_id, exp FROM users WHERE guild_id = {placeholder} AND user_id IN ({marks})",
+                                        (guild_id, *(user_id for user_id, _ in chunk)), fetch="all")
+            exp_after.update((user_id, exp) for user_id, exp in rows)
+        await _bump_activity(tx, guild_id, today, [(user_id, 0, 0, 0, 0, amount) for user_id, (_, amount) in items])
+    board = _leaderboard(guild_id)
+    results = []
+    for user_id, (nickname, amount) in items:
+        _remember_user(guild_id, user_id, nickname)
+        if board is not None:
+            board.add(user_id, amount, nickname)
+        results.append((user_id, exp_after[user_id] - amount, exp_after[user_id]))
+    return results
 
-async def remove_exp(user_id: str, amount: int):
-    current = await get_exp(user_id)
-    new_exp = max(0, current - amount)
-    await db_execute(f"UPDATE users SET exp = {placeholder} WHERE user_id = {placeholder}", (new_exp, user_id))
+async def remove_exp(guild_id: str, user_id: str, amount: int):
+    """경험치를 amount만큼 빼고(0 밑으로는 안 내려감) (이전 exp, 이후 exp)를 반환"""
+    if is_postgres:
+        row = await db_execute(f"""
+        UPDATE users SET exp = GREATEST(0, users.exp - {placeholder})
+        FROM (SELECT guild_id, user_id, exp FROM users WHERE guild_id = {placeholder} AND user_id = {placeholder} FOR UPDATE) AS prev
+        WHERE users.guild_id = prev.guild_id AND users.user_id = prev.user_id
+        RETURNING prev.exp, users.exp
+        """, (amount, guild_id, user_id), fetch="one")
+    else:
+        # SQLite의 RETURNING은 갱신 전 값을 돌려주지 못하므로, 쓰기 잠금을 먼저 잡고 읽은 뒤 갱신
+        async with db_transaction() as tx:
+            await tx.execute("BEGIN IMMEDIATE")
+            before = await tx.execute("SELECT exp FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id), fetch="one")
+            row = None
+            if before:
+                row = (before[0], max(0, before[0] - amount))
+                await tx.execute("UPDATE users SET exp = ? WHERE guild_id = ? AND user_id = ?", (row[1], guild_id, user_id))
+    if not row:
+        return 0, 0
+    board = _leaderboard(guild_id)
+    if board is not None:
+        board.add(user_id, row[1] - row[0])
+    return row[0], row[1]
 
-async def set_exp(user_id: str, nickname: str, new_exp: int):
-    await _register_user(user_id, nickname)
-    await db_execute(f"UPDATE users SET exp = {placeholder} WHERE user_id = {placeholder}", (new_exp, user_id))
+async def set_exp(guild_id: str, user_id: str, nickname: str, new_exp: int):
+    query = f"""
+    INSERT INTO users (guild_id, user_id, nickname, exp) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT (guild_id, user_id) DO UPDATE SET nickname = EXCLUDED.nickname, exp = EXCLUDED.exp
+    """
+    await db_execute(query, (guild_id, user_id, nickname, new_exp))
+    _remember_user(guild_id, user_id, nickname)
+    board = _leaderboard(guild_id)
+    if board is not None:
+        board.set(user_id, new_exp, nickname)
 
-async def get_exp(user_id: str) -> int:
-    row = await db_execute(f"SELECT exp FROM users WHERE user_id = {placeholder}", (user_id,), fetch="one")
+async def get_exp(guild_id: str, user_id: str) -> int:
+    row = await db_execute(
+        f"SELECT exp FROM users WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (guild_id, user_id), fetch="one"
+    )
     return row[0] if row else 0
 
-async def get_top_users_by_exp(limit: int = 10):
-    query = f"SELECT nickname, exp FROM users ORDER BY exp DESC LIMIT {placeholder if is_postgres else limit}"
-    params = (limit,) if is_postgres else ()
+async def get_top_users_by_exp(guild_id: str, limit: int = 10):
+    board = _leaderboard(guild_id)
+    if board is not None:
+        return board.top(limit)
+    query = f"SELECT nickname, exp FROM users WHERE guild_id = {placeholder} ORDER BY exp DESC LIMIT {placeholder if is_postgres else limit}"
+    params = (guild_id,) + ((limit,) if is_postgres else ())
     return await db_execute(query, params, fetch="all")
 
-async def get_monthly_stats(user_id: str):
-    now = datetime.now(timezone("Asia/Seoul"))
-    month_start = now.replace(day=1).strftime("%Y-%m-%d")
-    query_params = (user_id, month_start, now.strftime("%Y-%m-%d"))
-    attendance = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM attendance WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    wakeup = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM wakeup WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    study_days = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM study WHERE user_id = {placeholder} AND minutes >= 10 AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    study_minutes = (await db_execute(f"SELECT COALESCE(SUM(minutes), 0) FROM study WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    return { "attendance": attendance, "wakeup": wakeup, "study_days": study_days, "study_minutes": study_minutes }
-
-async def get_weekly_stats(user_id: str):
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 메모리 경험치 순위표: 시작할 때 한 번 읽고, 이후에는 경험치 변경 시 같이 갱신
+# - 서버마다 순위표 하나 (처음 보는 서버는 빈 순위표에서 시작)
+# - 로드 전에는 get_top_users_by_exp 등이 기존처럼 DB에서 조회
+# ====================================================================================
+leaderboards = {}  # guild_id -> Leaderboard
+_leaderboards_loaded = False
+
+def _leaderboard(guild_id: str):
+    """로드가 끝났으면 guild_id의 순위표, 아니면 None"""
+    if not _leaderboards_loaded:
+        return None
+    board = leaderboards.get(guild_id)
+    if board is None:
+        board = leaderboards[guild_id] = Leaderboard()
+    return board
+
+async def load_leaderboard():
+    global _leaderboards_loaded
+    rows = await db_execute("SELECT guild_id, user_id, nickname, exp FROM users", fetch="all")
+    by_guild = {}
+    for guild_id, *row in rows:
+        by_guild.setdefault(guild_id, []).append(row)
+    leaderboards.clear()
+    for guild_id, guild_rows in by_guild.items():
+        leaderboards[guild_id] = Leaderboard()
+        leaderboards[guild_id].load(guild_rows)
+    _leaderboards_loaded = True
+
+async def get_user_rank(guild_id: str, user_id: str):
+    """(순위, 전체 인원) 반환. 등록되지 않은 유저면 None"""
+    board = _leaderboard(guild_id)
+    if board is not None:
+        return board.rank(user_id)
+    row = await db_execute(f"""
+    SELECT
+        (SELECT COUNT(*) FROM users AS other
+         WHERE other.guild_id = me.guild_id
+           AND (other.exp > me.exp OR (other.exp = me.exp AND other.user_id < me.user_id))) + 1,
+        (SELECT COUNT(*) FROM users AS other WHERE other.guild_id = me.guild_id)
+    FROM users AS me WHERE me.guild_id = {placeholder} AND me.user_id = {placeholder}
+    """, (guild_id, user_id), fetch="one")
+    return (row[0], row[1]) if row else None
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 통계 스냅샷: 원본 기록 대신 집계 테이블에서 이번달/이번주/전체 통계를 쿼리 한 번으로 조회
+# - 이번달: monthly_activity 1행, 이번주: daily_activity 최대 7행, 전체: monthly_activity 개월 수만큼
+# - daily_activity / monthly_activity는 출석/기상/공부/경험치를 저장하는 트랜잭션 안에서 함께 갱신
+# ====================================================================================
+_SNAPSHOT_METRICS = ("attendance", "wakeup", "study_days", "study_minutes")
+
+_SNAPSHOT_QUERY = f"""
+SELECT 'month', attended_days, wakeup_days, study_days, study_minutes
+FROM monthly_activity WHERE guild_id = {placeholder} AND user_id = {placeholder} AND month = {placeholder}
+UNION ALL
+SELECT 'week', COALESCE(SUM(attended), 0), COALESCE(SUM(woke_up), 0),
+       COALESCE(SUM(CASE WHEN study_minutes >= 10 THEN 1 ELSE 0 END), 0), COALESCE(SUM(study_minutes), 0)
+FROM daily_activity WHERE guild_id = {placeholder} AND user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}
+UNION ALL
+SELECT 'total', COALESCE(SUM(attended_days), 0), COALESCE(SUM(wakeup_days), 0),
+       COALESCE(SUM(study_days), 0), COALESCE(SUM(study_minutes), 0)
+FROM monthly_activity WHERE guild_id = {placeholder} AND user_id = {placeholder}
+"""
+
+async def get_user_stats_snapshot(guild_id: str, user_id: str):
+    """{"month": {...}, "week": {...}, "total": {...}} 형태로 출석/기상/공부일수/공부시간을 반환"""
     now = datetime.now(timezone("Asia/Seoul"))
+    today = now.strftime("%Y-%m-%d")
+    month = now.strftime("%Y-%m")
     week_start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
-    query_params = (user_id, week_start, now.strftime("%Y-%m-%d"))
-    attendance = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM attendance WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    wakeup = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM wakeup WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    study_days = (await db_execute(f"SELECT COUNT(DISTINCT date) FROM study WHERE user_id = {placeholder} AND minutes >= 10 AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    study_minutes = (await db_execute(f"SELECT COALESCE(SUM(minutes), 0) FROM study WHERE user_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder}", query_params, fetch="one"))[0]
-    return { "attendance": attendance, "wakeup": wakeup, "study_days": study_days, "study_minutes": study_minutes }
-
-def _calculate_streak_from_dates(date_list):
-    if not date_list: return 0
+    params = (guild_id, user_id, month, guild_id, user_id, week_start, today, guild_id, user_id)
+    rows = await db_execute(_SNAPSHOT_QUERY, params, fetch="all")
+    snapshot = {period: dict.fromkeys(_SNAPSHOT_METRICS, 0) for period in ("month", "week", "total")}
+    for period, *values in rows:
+        snapshot[period] = {name: int(value) for name, value in zip(_SNAPSHOT_METRICS, values)}
+    return snapshot
+
+async def get_monthly_stats(guild_id: str, user_id: str):
+    return (await get_user_stats_snapshot(guild_id, user_id))["month"]
+
+async def get_weekly_stats(guild_id: str, user_id: str):
+    return (await get_user_stats_snapshot(guild_id, user_id))["week"]
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 연속 기록: 전체 기록을 다시 읽지 않고 streaks 테이블의 카운터를 바로 조회
+# - 출석/기상/공부 기록을 저장하는 트랜잭션 안에서 카운터도 함께 갱신
+# ====================================================================================
+_STREAK_KINDS = ("attendance", "wakeup", "study")
+_STREAK_SOURCES = {
+    "attendance": "SELECT DISTINCT guild_id, user_id, date FROM attendance WHERE 1 = 1",
+    "wakeup": "SELECT DISTINCT guild_id, user_id, date FROM wakeup WHERE 1 = 1",
+    "study": "SELECT DISTINCT guild_id, user_id, date FROM study WHERE minutes >= 10",
+}
+_GREATEST = "GREATEST" if is_postgres else "MAX"
+# 마지막 기록이 오늘이면 그대로, 어제면 +1, 그보다 전이면 1부터 다시
+_NEXT_STREAK = f"""CASE WHEN streaks.last_date = {placeholder} THEN streaks.current_streak
+    WHEN streaks.last_date = {placeholder} THEN streaks.current_streak + 1 ELSE 1 END"""
+
+async def _bump_streak(tx, guild_id: str, user_id: str, kind: str, today: str):
+    yesterday = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    query = f"""
+    INSERT INTO streaks (guild_id, user_id, kind, current_streak, longest_streak, last_date)
+    VALUES ({placeholder}, {placeholder}, {placeholder}, 1, 1, {placeholder})
+    ON CONFLICT (guild_id, user_id, kind) DO UPDATE SET
+        current_streak = {_NEXT_STREAK},
+        longest_streak = {_GREATEST}(streaks.longest_streak, {_NEXT_STREAK}),
+        last_date = EXCLUDED.last_date
+    WHERE streaks.last_date IS NULL OR streaks.last_date <= EXCLUDED.last_date
+    """
+    await tx.execute(query, (guild_id, user_id, kind, today, today, yesterday, today, yesterday))
+
+def _live_streak(current_streak, last_date):
+    """마지막 기록이 오늘/어제가 아니면 연속 기록은 이미 끊긴 것"""
     today = datetime.now(timezone("Asia/Seoul")).date()
-    streak = 0
-    unique_dates = sorted(list(set(d[0] for d in date_list)), reverse=True)
-    if not unique_dates or datetime.strptime(unique_dates[0], "%Y-%m-%d").date() not in [today, today - timedelta(days=1)]:
-        if not unique_dates or datetime.strptime(unique_dates[0], "%Y-%m-%d").date() != today - timedelta(days=1):
-            return 0
-    current_date = today if unique_dates and datetime.strptime(unique_dates[0], "%Y-%m-%d").date() == today else today - timedelta(days=1)
-    for d_str in unique_dates:
-        d_date = datetime.strptime(d_str, "%Y-%m-%d").date()
-        if d_date == current_date:
-            streak += 1
-            current_date -= timedelta(days=1)
-        else:
-            break
-    return streak
+    if last_date not in (today.strftime("%Y-%m-%d"), (today - timedelta(days=1)).strftime("%Y-%m-%d")):
+        return 0
+    return current_streak
+
+async def get_streaks(guild_id: str, user_id: str):
+    """{"attendance": {"current": n, "longest": m}, "wakeup": {...}, "study": {...}}"""
+    rows = await db_execute(
+        f"SELECT kind, current_streak, longest_streak, last_date FROM streaks WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (guild_id, user_id), fetch="all"
+    )
+    streaks = {kind: {"current": 0, "longest": 0} for kind in _STREAK_KINDS}
+    for kind, current_streak, longest_streak, last_date in rows:
+        streaks[kind] = {"current": _live_streak(current_streak, last_date), "longest": longest_streak}
+    return streaks
+
+async def _get_streak(guild_id: str, user_id: str, kind: str):
+    row = await db_execute(
+        f"SELECT current_streak, last_date FROM streaks WHERE guild_id = {placeholder} AND user_id = {placeholder} AND kind = {placeholder}",
+        (guild_id, user_id, kind), fetch="one"
+    )
+    return _live_streak(row[0], row[1]) if row else 0
 
-async def get_streak_attendance(user_id: str):
-    rows = await db_execute(f"SELECT date FROM attendance WHERE user_id = {placeholder} ORDER BY date DESC", (user_id,), fetch="all")
-    return _calculate_streak_from_dates(rows)
+async def get_streak_attendance(guild_id: str, user_id: str):
+    return await _get_streak(guild_id, user_id, "attendance")
 
-async def get_streak_wakeup(user_id: str):
-    rows = await db_execute(f"SELECT date FROM wakeup WHERE user_id = {placeholder} ORDER BY date DESC", (user_id,), fetch="all")
-    return _calculate_streak_from_dates(rows)
+async def get_streak_wakeup(guild_id: str, user_id: str):
+    return await _get_streak(guild_id, user_id, "wakeup")
 
-async def get_streak_study(user_id: str):
-    rows = await db_execute(f"SELECT date FROM study WHERE user_id = {placeholder} AND minutes >= 10 ORDER BY date DESC", (user_id,), fetch="all")
-    return _calculate_streak_from_dates(rows)
+async def get_streak_study(guild_id: str, user_id: str):
+    return await _get_streak(guild_id, user_id, "study")
+
+# 날짜 문자열(YYYY-MM-DD)을 하루 단위 정수로 바꾸는 식 (연속된 날짜는 1씩 증가)
+_DAY_NUMBER = "(CAST(date AS DATE) - DATE '2000-01-01')" if is_postgres else "CAST(julianday(date) AS INTEGER)"
+
+def _streak_islands_cte(source):
+    """source(guild_id, user_id, date, 유저별 날짜 중복 없음)의 연속 구간(섬)을 islands(guild_id, user_id, last_date, length)로 만드는 CTE"""
+    return f"""
+    days AS ({source}),
+    islands AS (
+        SELECT guild_id, user_id, MAX(date) AS last_date, COUNT(*) AS length
+        FROM (
+            SELECT guild_id, user_id, date,
+                   {_DAY_NUMBER} - ROW_NUMBER() OVER (PARTITION BY guild_id, user_id ORDER BY date) AS grp
+            FROM days
+        ) AS numbered
+        GROUP BY guild_id, user_id, grp
+    )"""
+
+async def rebuild_streaks(guild_id: str = None):
+    """전체 기록으로 streaks 테이블을 다시 계산 (최초 백필/관리자 재계산용, guild_id를 주면 그 서버만)"""
+    condition = "" if guild_id is None else f" AND guild_id = {placeholder}"
+    params = () if guild_id is None else (guild_id,)
+    async with db_transaction() as tx:
+        await tx.execute(f"DELETE FROM streaks WHERE 1 = 1{condition}", params)
+        for kind in _STREAK_KINDS:
+            # 가장 최근 구간이 현재 연속 기록, 가장 긴 구간이 최장 기록
+            await tx.execute(f"""
+            WITH {_streak_islands_cte(_STREAK_SOURCES[kind] + condition)}
+            INSERT INTO streaks (guild_id, user_id, kind, current_streak, longest_streak, last_date)
+            SELECT islands.guild_id, islands.user_id, '{kind}', islands.length, latest.longest, islands.last_date
+            FROM islands
+            JOIN (SELECT guild_id, user_id, MAX(last_date) AS last_date, MAX(length) AS longest
+                  FROM islands GROUP BY guild_id, user_id) AS latest
+                ON latest.guild_id = islands.guild_id AND latest.user_id = islands.user_id
+               AND latest.last_date = islands.last_date
+            """, params)
+    for cache in ([get_ranking_cache(guild_id)] if guild_id is not None else list(_ranking_caches.values())):
+        cache.invalidate()
 
 # ====================================================================================
 # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
 # [수정/신규] 휘발성 상태 관리 함수들 (multiplier 지원)
+# [수정] 공부 세션: 메모리 딕셔너리가 기준이고 study_sessions 테이블은 재시작 대비용 (write-through)
+# - 시작할 때 load_study_sessions()로 테이블에서 다시 채움
+# - 로드 전에는 기존처럼 DB에서 조회
+# - 같은 유저가 여러 서버의 음성 채널에 동시에 있을 수 있으므로 키는 (guild_id, user_id)
 # ====================================================================================
-async def start_study_session(user_id: str, start_time: datetime, message_id: int):
+_sessions = {}
+_sessions_loaded = False
+
+def _session_from_row(row):
+    return {'start': datetime.fromisoformat(row[0]), 'msg_id': int(row[1]), 'multiplier': int(row[2])}
+
+async def load_study_sessions():
+    global _sessions_loaded
+    rows = await db_execute("SELECT guild_id, user_id, start_time, message_id, multiplier FROM study_sessions", fetch="all")
+    _sessions.clear()
+    for row in rows:
+        _sessions[(row[0], row[1])] = _session_from_row(row[2:])
+    _sessions_loaded = True
+
+async def start_study_session(guild_id: str, user_id: str, start_time: datetime, message_id: int):
+    _sessions[(guild_id, user_id)] = {'start': start_time, 'msg_id': int(message_id), 'multiplier': 1}
     # ON CONFLICT 구문은 PostgreSQL과 SQLite 3.24.0+ 에서만 지원됩니다.
     # 이전 버전의 SQLite를 사용한다면 SELECT 후 INSERT/UPDATE 하는 방식으로 변경해야 합니다.
     query = f"""
-    INSERT INTO study_sessions (user_id, start_time, message_id, multiplier) VALUES ({placeholder}, {placeholder}, {placeholder}, 1)
-    ON CONFLICT(user_id) DO UPDATE SET start_time = EXCLUDED.start_time, message_id = EXCLUDED.message_id, multiplier = 1
+    INSERT INTO study_sessions (guild_id, user_id, start_time, message_id, multiplier) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, 1)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET start_time = EXCLUDED.start_time, message_id = EXCLUDED.message_id, multiplier = 1
     """
-    await db_execute(query, (user_id, start_time.isoformat(), str(message_id)))
+    await db_execute(query, (guild_id, user_id, start_time.isoformat(), str(message_id)))
 
-async def end_study_session(user_id: str):
-    session = await db_execute(
-        f"SELECT start_time, message_id, multiplier FROM study_sessions WHERE user_id = {placeholder}",
-        (user_id,),
-        fetch="one"
-    )
-    if session:
-        await db_execute(f"DELETE FROM study_sessions WHERE user_id = {placeholder}", (user_id,))
-        start_time = datetime.fromisoformat(session[0])
-        message_id = int(session[1])
-        multiplier = int(session[2])
-        return {'start': start_time, 'msg_id': message_id, 'multiplier': multiplier}
-    return None
+async def end_study_session(guild_id: str, user_id: str):
+    """세션을 꺼내서 삭제하고 반환. 없으면 None"""
+    # 메모리에서 먼저 꺼내므로 같은 퇴장 이벤트가 겹쳐도 한 번만 처리됨
+    session = _sessions.pop((guild_id, user_id), None)
+    if _sessions_loaded and session is None:
+        return None
+    query = f"DELETE FROM study_sessions WHERE guild_id = {placeholder} AND user_id = {placeholder}"
+    if _has_returning:
+        row = await db_execute(query + " RETURNING start_time, message_id, multiplier", (guild_id, user_id), fetch="one")
+    else:
+        async with db_transaction() as tx:
+            row = await tx.execute(
+                f"SELECT start_time, message_id, multiplier FROM study_sessions WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+                (guild_id, user_id), fetch="one"
+            )
+            if row:
+                await tx.execute(query, (guild_id, user_id))
+    if session is None and row:
+        session = _session_from_row(row)
+    return session
 
 # [신규] 공부 세션 전체 정보 조회
-async def get_study_session(user_id: str):
+async def get_study_session(guild_id: str, user_id: str):
+    if _sessions_loaded:
+        session = _sessions.get((guild_id, user_id))
+        return dict(session) if session else None
     session = await db_execute(
-        f"SELECT start_time, message_id, multiplier FROM study_sessions WHERE user_id = {placeholder}",
-        (user_id,),
+        f"SELECT start_time, message_id, multiplier FROM study_sessions WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (guild_id, user_id),
         fetch="one"
     )
     if session:
-        return {'start': datetime.fromisoformat(session[0]), 'msg_id': int(session[1]), 'multiplier': int(session[2])}
+        return _session_from_row(session)
     return None
 
 # [신규] 공부 세션 경험치 배율 업데이트
-async def update_study_multiplier(user_id: str, multiplier: int):
+async def update_study_multiplier(guild_id: str, user_id: str, multiplier: int):
+    session = _sessions.get((guild_id, user_id))
+    if session is not None:
+        if session['multiplier'] == multiplier:
+            return  # 카메라를 다시 켜는 등 값이 그대로면 DB는 건드리지 않음
+        session['multiplier'] = multiplier
+    elif _sessions_loaded:
+        return  # 진행 중인 세션이 없음
     await db_execute(
-        f"UPDATE study_sessions SET multiplier = {placeholder} WHERE user_id = {placeholder}",
-        (multiplier, user_id)
+        f"UPDATE study_sessions SET multiplier = {placeholder} WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (multiplier, guild_id, user_id)
     )
 
 # [신규] 공부 세션 강제 삭제 (강퇴 시 사용)
-async def delete_study_session(user_id: str):
-    await db_execute(f"DELETE FROM study_sessions WHERE user_id = {placeholder}", (user_id,))
+async def delete_study_session(guild_id: str, user_id: str):
+    _sessions.pop((guild_id, user_id), None)
+    await db_execute(f"DELETE FROM study_sessions WHERE guild_id = {placeholder} AND user_id = {placeholder}", (guild_id, user_id))
+
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 구글 시트 전송 대기열 (sheets.SheetOutbox에서 사용)
+# ====================================================================================
+async def spool_sheet_rows(rows):
+    """[(sheet, payload_json), ...]을 한 트랜잭션으로 저장"""
+    now = time.time()
+    async with db_transaction() as tx:
+        for sheet, payload in rows:
+            await tx.execute(
+                f"INSERT INTO sheet_outbox (sheet, payload, created_at) VALUES ({placeholder}, {placeholder}, {placeholder})",
+                (sheet, payload, now)
+            )
+
+async def get_spooled_sheet_rows(limit: int = 200):
+    """오래된 순서로 [(id, sheet, payload_json, created_at), ...]"""
+    query = f"SELECT id, sheet, payload, created_at FROM sheet_outbox ORDER BY id LIMIT {placeholder if is_postgres else limit}"
+    params = (limit,) if is_postgres else ()
+    return await db_execute(query, params, fetch="all")
+
+async def count_spooled_sheet_rows() -> int:
+    return (await db_execute("SELECT COUNT(*) FROM sheet_outbox", fetch="one"))[0]
+
+async def delete_spooled_sheet_rows(ids):
+    if not ids: return
+    marks = ", ".join([placeholder] * len(ids))
+    await db_execute(f"DELETE FROM sheet_outbox WHERE id IN ({marks})", tuple(ids))
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 예약 작업 저장소 (scheduler.JobScheduler에서 사용)
+# ====================================================================================
+async def upsert_scheduled_job(job_type: str, guild_id: str, user_id: str, run_at: float, payload):
+    query = f"""
+    INSERT INTO scheduled_jobs (guild_id, job_type, user_id, run_at, payload) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT(guild_id, job_type, user_id) DO UPDATE SET run_at = EXCLUDED.run_at, payload = EXCLUDED.payload
+    """
+    await db_execute(query, (guild_id, job_type, user_id, run_at, payload))
+
+async def delete_scheduled_job(job_type: str, guild_id: str, user_id: str, run_at: float = None):
+    """run_at을 주면 그 시각의 예약일 때만 삭제 (그 사이 다시 예약된 건 유지)"""
+    query = f"DELETE FROM scheduled_jobs WHERE guild_id = {placeholder} AND job_type = {placeholder} AND user_id = {placeholder}"
+    params = (guild_id, job_type, user_id)
+    if run_at is not None:
+        query += f" AND run_at = {placeholder}"
+        params += (run_at,)
+    await db_execute(query, params)
 
+async def get_scheduled_jobs():
+    """[(job_type, guild_id, user_id, run_at, payload), ...]"""
+    return await db_execute("SELECT job_type, guild_id, user_id, run_at, payload FROM scheduled_jobs", fetch="all")
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] bot_state: 재시작 후에도 유지할 값 (명령어 트리 해시 등)
+# ====================================================================================
+async def get_bot_state(key: str):
+    row = await db_execute(f"SELECT value FROM bot_state WHERE key = {placeholder}", (key,), fetch="one")
+    return row[0] if row else None
+
+async def set_bot_state(key: str, value):
+    query = f"""
+    INSERT INTO bot_state (key, value) VALUES ({placeholder}, {placeholder})
+    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+    """
+    await db_execute(query, (key, None if value is None else str(value)))
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 메시지 위치 저장소: (guild_id, kind, user_id) → (channel_id, message_id)
+# - 내정보("myinfo", 유저 ID)와 랭킹("ranking", "") 메시지를 재시작 후에도 다시 수정할 수 있게 DB에 보관
+# - 앞에 LRU 캐시를 둬서 반복 조회는 DB까지 가지 않음 (없는 것도 None으로 기억)
+# ====================================================================================
+_message_refs = OrderedDict()
+
+def _remember_message_ref(guild_id: str, kind: str, user_id: str, ref):
+    key = (guild_id, kind, user_id)
+    _message_refs[key] = ref
+    _message_refs.move_to_end(key)
+    while len(_message_refs) > MESSAGE_INDEX_CACHE_SIZE:
+        _message_refs.popitem(last=False)
+
+async def get_message_ref(guild_id: str, kind: str, user_id: str = ""):
+    """(channel_id, message_id) 또는 None. channel_id가 None이면 기본 채널"""
+    key = (guild_id, kind, user_id)
+    if key in _message_refs:
+        _message_refs.move_to_end(key)
+        return _message_refs[key]
+    row = await db_execute(
+        f"SELECT channel_id, message_id FROM message_index WHERE guild_id = {placeholder} AND kind = {placeholder} AND user_id = {placeholder}",
+        (guild_id, kind, user_id), fetch="one"
+    )
+    ref = (row[0], row[1]) if row else None
+    _remember_message_ref(guild_id, kind, user_id, ref)
+    return ref
+
+async def set_message_ref(guild_id: str, kind: str, user_id: str, channel_id: int, message_id: int):
+    query = f"""
+    INSERT INTO message_index (guild_id, kind, user_id, channel_id, message_id) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT (guild_id, kind, user_id) DO UPDATE SET channel_id = EXCLUDED.channel_id, message_id = EXCLUDED.message_id
+    """
+    await db_execute(query, (guild_id, kind, user_id, channel_id, message_id))
+    _remember_message_ref(guild_id, kind, user_id, (channel_id, message_id))
+
+async def add_message_refs(rows) -> int:
+    """[(guild_id, kind, user_id, channel_id, message_id), ...]를 이미 있는 항목은 건드리지 않고 추가. 새로 들어간 수 반환"""
+    query = f"""
+    INSERT INTO message_index (guild_id, kind, user_id, channel_id, message_id) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT (guild_id, kind, user_id) DO NOTHING
+    """
+    added = 0
+    async with db_transaction() as tx:
+        for row in rows:
+            # 충돌로 건너뛴 행은 RETURNING이 아무것도 돌려주지 않음
+            if _has_returning:
+                inserted = await tx.execute(query + " RETURNING 1", row, fetch="one")
+            else:
+                await tx.execute(query, row)
+                inserted = (await tx.execute("SELECT changes()", fetch="one"))[0]
+            if inserted:
+                added += 1
+    # 없다고 기억해 둔 항목이 있을 수 있으므로 해당 캐시는 비움
+    for guild_id, kind, user_id, _, _ in rows:
+        _message_refs.pop((guild_id, kind, user_id), None)
+    return added
 
-async def add_wakeup_pending(user_id: str, message_id: int):
+async def add_wakeup_pending(guild_id: str, user_id: str, message_id: int):
     query = f"""
-    INSERT INTO wakeup_pending (user_id, message_id) VALUES ({placeholder}, {placeholder})
-    ON CONFLICT(user_id) DO UPDATE SET message_id = EXCLUDED.message_id
+    INSERT INTO wakeup_pending (guild_id, user_id, message_id) VALUES ({placeholder}, {placeholder}, {placeholder})
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET message_id = EXCLUDED.message_id
     """
-    await db_execute(query, (user_id, str(message_id)))
+    await db_execute(query, (guild_id, user_id, str(message_id)))
 
-async def get_and_remove_wakeup_pending(user_id: str):
-    pending = await db_execute(f"SELECT message_id FROM wakeup_pending WHERE user_id = {placeholder}", (user_id,), fetch="one")
+async def get_and_remove_wakeup_pending(guild_id: str, user_id: str):
+    pending = await db_execute(
+        f"SELECT message_id FROM wakeup_pending WHERE guild_id = {placeholder} AND user_id = {placeholder}",
+        (guild_id, user_id), fetch="one"
+    )
     if pending:
-        await db_execute(f"DELETE FROM wakeup_pending WHERE user_id = {placeholder}", (user_id,))
+        await db_execute(f"DELETE FROM wakeup_pending WHERE guild_id = {placeholder} AND user_id = {placeholder}", (guild_id, user_id))
         return int(pending[0])
     return None
 
-async def get_streak_rankings(limit: int = 10):
-    all_users = await db_execute("SELECT DISTINCT user_id FROM attendance", fetch="all")
-    streaks = []
-    for (user_id,) in all_users:
-        s = await get_streak_attendance(user_id)
-        if s > 0: streaks.append((user_id, s))
-    streaks.sort(key=lambda x: x[1], reverse=True)
-    top_users = []
-    for user_id, streak_count in streaks[:limit]:
-        nickname = await db_execute(f"SELECT nickname FROM users WHERE user_id = {placeholder}", (user_id,), fetch="one")
-        top_users.append({'user_id': user_id, 'nickname': nickname[0] if nickname else '알 수 없는 유저', 'streak': streak_count})
-    return top_users
-
-async def get_total_attendance_rankings(limit: int = 10):
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 일별/월별 활동 집계 (마이그레이션 4)
+# - 원본 기록을 저장하는 트랜잭션 안에서 tx를 넘겨받아 증감분만 더함
+# ====================================================================================
+# 행당 바인딩 변수 8개 (월별) → SQLite 999개 제한 안쪽
+_ACTIVITY_CHUNK_SIZE = 100
+
+async def _bump_activity(tx, guild_id: str, day: str, rows):
+    """rows: [(user_id, attended, woke_up, study_minutes, study_day, exp_gained), ...]"""
+    month = day[:7]
+    for start in range(0, len(rows), _ACTIVITY_CHUNK_SIZE):
+        chunk = rows[start:start + _ACTIVITY_CHUNK_SIZE]
+        values = ", ".join([f"({', '.join([placeholder] * 7)})"] * len(chunk))
+        params = tuple(v for user_id, attended, woke_up, minutes, _, exp in chunk
+                       for v in (guild_id, user_id, day, attended, woke_up, minutes, exp))
+        await tx.execute(f"""
+        INSERT INTO daily_activity (guild_id, user_id, date, attended, woke_up, study_minutes, exp_gained) VALUES {values}
+        ON CONFLICT (guild_id, user_id, date) DO UPDATE SET
+            attended = daily_activity.attended + EXCLUDED.attended,
+            woke_up = daily_activity.woke_up + EXCLUDED.woke_up,
+            study_minutes = daily_activity.study_minutes + EXCLUDED.study_minutes,
+            exp_gained = daily_activity.exp_gained + EXCLUDED.exp_gained
+        """, params)
+        values = ", ".join([f"({', '.join([placeholder] * 8)})"] * len(chunk))
+        params = tuple(v for user_id, attended, woke_up, minutes, study_day, exp in chunk
+                       for v in (guild_id, user_id, month, attended, woke_up, study_day, minutes, exp))
+        await tx.execute(f"""
+        INSERT INTO monthly_activity (guild_id, user_id, month, attended_days, wakeup_days, study_days, study_minutes, exp_gained) VALUES {values}
+        ON CONFLICT (guild_id, user_id, month) DO UPDATE SET
+            attended_days = monthly_activity.attended_days + EXCLUDED.attended_days,
+            wakeup_days = monthly_activity.wakeup_days + EXCLUDED.wakeup_days,
+            study_days = monthly_activity.study_days + EXCLUDED.study_days,
+            study_minutes = monthly_activity.study_minutes + EXCLUDED.study_minutes,
+            exp_gained = monthly_activity.exp_gained + EXCLUDED.exp_gained
+        """, params)
+
+async def rebuild_activity_rollups(guild_id: str = None):
+    """원본 기록(attendance/wakeup/study)으로 daily_activity / monthly_activity를 다시 계산
+
+    집계가 어긋났을 때 복구용 (시작할 때 비어 있으면 한 번, /집계재계산으로 서버별).
+    경험치 획득량은 원본 기록이 없으므로 daily_activity에 있던 값을 그대로 두고 월별 합계만 다시 냄.
+    """
+    condition = "" if guild_id is None else f" AND guild_id = {placeholder}"
+    params = () if guild_id is None else (guild_id,)
+    async with db_transaction() as tx:
+        await tx.execute(f"UPDATE daily_activity SET attended = 0, woke_up = 0, study_minutes = 0 WHERE 1 = 1{condition}", params)
+        await tx.execute(f"""
+        INSERT INTO daily_activity (guild_id, user_id, date, attended, woke_up, study_minutes, exp_gained)
+        SELECT guild_id, user_id, date, MAX(attended), MAX(woke_up), SUM(minutes), 0
+        FROM (
+            SELECT guild_id, user_id, date, 1 AS attended, 0 AS woke_up, 0 AS minutes FROM attendance WHERE 1 = 1{condition}
+            UNION ALL SELECT guild_id, user_id, date, 0, 1, 0 FROM wakeup WHERE 1 = 1{condition}
+            UNION ALL SELECT guild_id, user_id, date, 0, 0, COALESCE(minutes, 0) FROM study WHERE 1 = 1{condition}
+        ) AS activity
+        WHERE 1 = 1
+        GROUP BY guild_id, user_id, date
+        ON CONFLICT (guild_id, user_id, date) DO UPDATE SET
+            attended = EXCLUDED.attended, woke_up = EXCLUDED.woke_up, study_minutes = EXCLUDED.study_minutes
+        """, params * 3)
+        await tx.execute(
+            f"DELETE FROM daily_activity WHERE attended = 0 AND woke_up = 0 AND study_minutes = 0 AND exp_gained = 0{condition}", params
+        )
+        await tx.execute(f"DELETE FROM monthly_activity WHERE 1 = 1{condition}", params)
+        await tx.execute(f"""
+        INSERT INTO monthly_activity (guild_id, user_id, month, attended_days, wakeup_days, study_days, study_minutes, exp_gained)
+        SELECT guild_id, user_id, SUBSTR(date, 1, 7), SUM(attended), SUM(woke_up),
+               SUM(CASE WHEN study_minutes >= 10 THEN 1 ELSE 0 END), SUM(study_minutes), SUM(exp_gained)
+        FROM daily_activity
+        WHERE 1 = 1{condition}
+        GROUP BY guild_id, user_id, SUBSTR(date, 1, 7)
+        """, params)
+    for cache in ([get_ranking_cache(guild_id)] if guild_id is not None else list(_ranking_caches.values())):
+        cache.invalidate()
+
+async def _bump_user_activity(tx, guild_id: str, user_id: str, day: str, attended=0, woke_up=0, study_minutes=0, study_day=0, exp_gained=0):
+    """study_day: 그날 공부 시간이 처음 10분을 넘었을 때 1 (월별 공부일수)"""
+    await _bump_activity(tx, guild_id, day, [(user_id, attended, woke_up, study_minutes, study_day, exp_gained)])
+
+async def get_weekly_study_rankings(guild_id: str, limit: int = 10):
+    """이번주(월요일부터) 공부 시간 순위"""
+    now = datetime.now(timezone("Asia/Seoul"))
+    week_start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+    query = f"""
+    SELECT t1.user_id, t2.nickname, t1.minutes
+    FROM (SELECT guild_id, user_id, SUM(study_minutes) AS minutes FROM daily_activity
+          WHERE guild_id = {placeholder} AND date >= {placeholder} AND date <= {placeholder} GROUP BY guild_id, user_id) AS t1
+    LEFT JOIN users AS t2 ON t1.guild_id = t2.guild_id AND t1.user_id = t2.user_id
+    WHERE t1.minutes > 0
+    ORDER BY t1.minutes DESC, t1.user_id
+    LIMIT {placeholder if is_postgres else limit}
+    """
+    params = (guild_id, week_start, now.strftime("%Y-%m-%d")) + ((limit,) if is_postgres else ())
+    rows = await db_execute(query, params, fetch="all")
+    return [{'user_id': r[0], 'nickname': r[1] or '알 수 없는 유저', 'minutes': int(r[2])} for r in rows]
+
+async def get_monthly_wakeup_rankings(guild_id: str, limit: int = 10):
+    """이번달 기상 인증 횟수 순위"""
+    month = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m")
+    query = f"""
+    SELECT t1.user_id, t2.nickname, t1.wakeup_days
+    FROM monthly_activity AS t1
+    LEFT JOIN users AS t2 ON t1.guild_id = t2.guild_id AND t1.user_id = t2.user_id
+    WHERE t1.guild_id = {placeholder} AND t1.month = {placeholder} AND t1.wakeup_days > 0
+    ORDER BY t1.wakeup_days DESC, t1.user_id
+    LIMIT {placeholder if is_postgres else limit}
+    """
+    params = (guild_id, month) + ((limit,) if is_postgres else ())
+    rows = await db_execute(query, params, fetch="all")
+    return [{'user_id': r[0], 'nickname': r[1] or '알 수 없는 유저', 'count': r[2]} for r in rows]
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 연속/누적 출석 랭킹: !출석 답장마다 붙는 버튼이라 결과를 RANKING_CACHE_TTL초 동안 재사용
+# - 출석이 새로 저장되거나 연속 기록을 다시 계산하면 그 서버의 캐시만 바로 무효화
+# - 연속 출석은 '오늘/어제' 기준이라 키에 날짜를 넣어 자정이 지나면 새로 계산
+# - 연속 출석은 streaks 카운터와 users를 한 번에 조인해서 계산
+# ====================================================================================
+_ranking_caches = {}  # guild_id -> ResultCache
+
+def get_ranking_cache(guild_id: str) -> ResultCache:
+    cache = _ranking_caches.get(guild_id)
+    if cache is None:
+        cache = _ranking_caches[guild_id] = ResultCache(RANKING_CACHE_TTL)
+    return cache
+
+async def get_streak_rankings(guild_id: str, limit: int = 10):
+    today = datetime.now(timezone("Asia/Seoul")).strftime("%Y-%m-%d")
+    return await get_ranking_cache(guild_id).get(("streak", today, limit), lambda: _query_streak_rankings(guild_id, today, limit))
+
+async def get_total_attendance_rankings(guild_id: str, limit: int = 10):
+    return await get_ranking_cache(guild_id).get(("total", limit), lambda: _query_total_attendance_rankings(guild_id, limit))
+
+async def _query_streak_rankings(guild_id: str, today: str, limit: int):
+    yesterday = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    # 오늘 또는 어제 출석한 유저만 '현재 진행 중인' 연속 출석
+    query = f"""
+    SELECT streaks.user_id, users.nickname, streaks.current_streak
+    FROM streaks
+    LEFT JOIN users ON users.guild_id = streaks.guild_id AND users.user_id = streaks.user_id
+    WHERE streaks.guild_id = {placeholder} AND streaks.kind = 'attendance' AND streaks.last_date IN ({placeholder}, {placeholder})
+    ORDER BY streaks.current_streak DESC, streaks.user_id
+    LIMIT {placeholder if is_postgres else limit}
+    """
+    params = (guild_id, today, yesterday) + ((limit,) if is_postgres else ())
+    rows = await db_execute(query, params, fetch="all")
+    return [{'user_id': r[0], 'nickname': r[1] or '알 수 없는 유저', 'streak': r[2]} for r in rows]
+
+async def _query_total_attendance_rankings(guild_id: str, limit: int):
     query = f"""
     SELECT t1.user_id, t2.nickname, t1.cnt
-    FROM (SELECT user_id, COUNT(*) as cnt FROM attendance GROUP BY user_id) as t1
-    LEFT JOIN users as t2 ON t1.user_id = t2.user_id
-    ORDER BY t1.cnt DESC
+    FROM (SELECT guild_id, user_id, SUM(attended_days) as cnt FROM monthly_activity
+          WHERE guild_id = {placeholder} GROUP BY guild_id, user_id HAVING SUM(attended_days) > 0) as t1
+    LEFT JOIN users as t2 ON t1.guild_id = t2.guild_id AND t1.user_id = t2.user_id
+    ORDER BY t1.cnt DESC, t1.user_id
     LIMIT {placeholder if is_postgres else limit}
     """
-    params = (limit,) if is_postgres else ()
+    params = (guild_id,) + ((limit,) if is_postgres else ())
     rows = await db_execute(query, params, fetch="all")
     return [{'user_id': r[0], 'nickname': r[1] or '알 수 없는 유저', 'count': r[2]} for r in rows]
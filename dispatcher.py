@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# UserEventDispatcher: 이벤트를 유저별 대기열에 넣고 유저마다 작업자 하나가 순서대로 처리
+# - 같은 유저의 이벤트는 들어온 순서대로 하나씩, 다른 유저끼리는 동시에 처리
+# - 동시에 실행되는 handler 수는 전체 concurrency개로 제한
+# - 대기열이 warn_depth를 넘으면 경고 로그 (이벤트는 버리지 않음)
+# ====================================================================================
+class UserEventDispatcher:
+    def __init__(self, handler, concurrency=4, warn_depth=100):
+        self.handler = handler
+        self.warn_depth = warn_depth
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues = {}   # key -> deque[(들어온 시각, args)]
+        self._workers = {}  # key -> Task
+        self._depth = 0
+        self._warned = False
+        # 상태 확인용 카운터
+        self.processed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_depth = 0
+        self.max_wait = 0.0     # 들어와서 실행되기까지 가장 오래 기다린 시간(초)
+        self._total_wait = 0.0
+
+    def submit(self, key, *args):
+        self._queues.setdefault(key, deque()).append((time.monotonic(), args))
+        self._depth += 1
+        self.max_depth = max(self.max_depth, self._depth)
+        if self._depth >= self.warn_depth and not self._warned:
+            self._warned = True
+            logger.warning(f"이벤트 대기열이 밀리고 있습니다: {self._depth}개 대기 중")
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.create_task(self._drain(key))
+
+    def depth(self):
+        return self._depth
+
+    async def join(self, key):
+        """key 대기열에 들어 있는 이벤트가 모두 처리될 때까지 기다림"""
+        worker = self._workers.get(key)
+        if worker is not None:
+            await asyncio.shield(worker)
+
+    def stats(self):
+        done = self.processed + self.failed
+        return {"depth": self._depth, "max_depth": self.max_depth, "running": self.running,
+                "active_users": len(self._queues), "processed": self.processed, "failed": self.failed,
+                "avg_wait": self._total_wait / done if done else 0.0, "max_wait": self.max_wait}
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                queued_at, args = queue[0]
+                async with self._semaphore:
+                    wait = time.monotonic() - queued_at
+                    self._total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    self.running += 1
+                    try:
+                        await self.handler(*args)
+                        self.processed += 1
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"이벤트 처리 중 오류 ({key}): {e}")
+                    finally:
+                        self.running -= 1
+                queue.popleft()
+                self._depth -= 1
+                if self._depth < self.warn_depth // 2:
+                    self._warned = False
+        finally:
+            if not queue:
+                self._queues.pop(key, None)
+                self._workers.pop(key, None)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# EditQueue: 메시지 수정 요청을 (채널, 메시지)별로 모아서 최신 것만 전송
+# - 같은 메시지에 대기 중인 수정이 있으면 새 내용으로 덮어씀 (이전 것은 버림)
+# - fetch_message 없이 PartialMessage로 바로 수정
+# - 메시지 수정 API의 rate limit은 채널 단위이므로 채널마다 작업자 하나가 순서대로 보내고,
+#   per/window 안에 rate번을 넘지 않도록 스스로 속도를 조절
+# ====================================================================================
+class EditQueue:
+    def __init__(self, rate=5, per=5.0):
+        self.rate = rate
+        self.per = per
+        self._pending = {}   # (channel_id, message_id) -> [channel, kwargs, on_missing, futures]
+        self._order = {}     # channel_id -> deque[(channel_id, message_id)]
+        self._workers = {}   # channel_id -> Task
+        self._recent = {}    # channel_id -> deque[보낸 시각]
+        # 상태 확인용 카운터
+        self.sent = 0
+        self.dropped = 0     # 더 새로운 수정에 덮여서 보내지 않은 수
+        self.not_found = 0
+        self.failed = 0
+
+    def submit(self, channel, message_id, *, on_missing=None, **kwargs):
+        """수정 예약. 반환된 Future는 이 내용(또는 이를 덮은 최신 내용)이 반영되면 True로 끝남.
+
+        on_missing: 메시지가 삭제돼 있을 때 대신 실행할 코루틴 함수 (예: 새로 보내기)
+        """
+        future = asyncio.get_running_loop().create_future()
+        key = (channel.id, message_id)
+        entry = self._pending.get(key)
+        if entry is not None:
+            self.dropped += 1
+            entry[:3] = [channel, kwargs, on_missing]
+            entry[3].append(future)
+        else:
+            self._pending[key] = [channel, kwargs, on_missing, [future]]
+            self._order.setdefault(channel.id, deque()).append(key)
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._drain(channel.id))
+        return future
+
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {"depth": self.depth(), "sent": self.sent, "dropped": self.dropped,
+                "not_found": self.not_found, "failed": self.failed}
+
+    async def _wait_for_slot(self, channel_id):
+        recent = self._recent.setdefault(channel_id, deque())
+        now = time.monotonic()
+        while recent and now - recent[0] >= self.per:
+            recent.popleft()
+        if len(recent) >= self.rate:
+            await asyncio.sleep(self.per - (now - recent[0]))
+            recent.popleft()
+        recent.append(time.monotonic())
+
+    async def _drain(self, channel_id):
+        order = self._order[channel_id]
+        while order:
+            # 기다리는 동안 들어온 수정도 반영되도록 자리를 먼저 확보한 뒤 꺼냄
+            await self._wait_for_slot(channel_id)
+            key = order.popleft()
+            channel, kwargs, on_missing, futures = self._pending.pop(key)
+            ok = await self._send(channel, key[1], kwargs, on_missing)
+            for future in futures:
+                if not future.done():
+                    future.set_result(ok)
+
+    async def _send(self, channel, message_id, kwargs, on_missing):
+        try:
+            await channel.get_partial_message(message_id).edit(**kwargs)
+            self.sent += 1
+            return True
+        except discord.NotFound:
+            self.not_found += 1
+            if on_missing is None:
+                return False
+            try:
+                await on_missing()
+                return True
+            except Exception as e:
+                logger.error(f"삭제된 메시지 대체 처리 중 오류: {e}")
+                return False
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"메시지 수정 실패 ({channel.id}/{message_id}): {e}")
+            return False
@@ -0,0 +1,110 @@
+import discord
+
+import db
+
+CHANNEL_KINDS = ("ranking", "honor", "myinfo", "attendance", "wakeup", "study_log", "cam_study")
+
+class GuildConfig:
+    """guild_config 한 행 (설정하지 않은 값은 None)"""
+    __slots__ = db.GUILD_CONFIG_COLUMNS
+
+    def __init__(self, **values):
+        for column in db.GUILD_CONFIG_COLUMNS:
+            setattr(self, column, values.get(column))
+
+    def channel_id(self, kind):
+        return getattr(self, f"{kind}_channel_id")
+
+    def tracked_voice_ids(self):
+        """설정된 음성 채널 ID 집합. 설정하지 않았으면 None (이름으로 찾음)"""
+        if self.tracked_voice_channel_ids is None:
+            return None
+        return frozenset(int(v) for v in self.tracked_voice_channel_ids.split(",") if v)
+
+_EMPTY = GuildConfig()
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# GuildConfigCache: 서버별 채널 설정을 시작할 때 한 번 읽고, 찾은 채널 객체까지 메모리에 보관
+# - 음성 이벤트마다 텍스트 채널 목록을 이름으로 훑지 않음 (처음 한 번만 찾고 결과를 기억)
+# - 공부기록 채널, 캠스터디 채널, 공부 음성 채널은 설정하지 않았으면 기본 이름으로 찾음
+# - 채널이 생기거나 지워지거나 이름이 바뀌면 invalidate(guild_id)로 그 서버만 다시 찾게 함
+# ====================================================================================
+class GuildConfigCache:
+    def __init__(self, study_log_name, tracked_voice_names, cam_study_name):
+        self.study_log_name = study_log_name
+        self.cam_study_name = cam_study_name
+        self.tracked_voice_names = tuple(tracked_voice_names)
+        self._configs = {}   # guild_id(int) -> GuildConfig
+        self._channels = {}  # (guild_id, kind) -> 채널 객체 또는 None
+        self._tracked = {}   # guild_id -> frozenset(음성 채널 ID)
+        self.resolves = 0    # 캐시에 없어서 채널을 새로 찾은 횟수
+
+    async def load(self):
+        configs = await db.get_guild_configs()
+        self._configs = {int(guild_id): GuildConfig(**values) for guild_id, values in configs.items()}
+        self._channels.clear()
+        self._tracked.clear()
+
+    def get(self, guild_id) -> GuildConfig:
+        return self._configs.get(int(guild_id), _EMPTY)
+
+    def is_configured(self, guild_id) -> bool:
+        return int(guild_id) in self._configs
+
+    def channel(self, guild, kind):
+        """guild에서 kind 용도로 쓰는 채널 (cam_study만 음성 채널, 없으면 None)"""
+        key = (guild.id, kind)
+        if key in self._channels:
+            return self._channels[key]
+        self.resolves += 1
+        channel_id = self.get(guild.id).channel_id(kind)
+        if channel_id:
+            channel = guild.get_channel(int(channel_id))
+        elif kind == "study_log":
+            channel = discord.utils.get(guild.text_channels, name=self.study_log_name)
+        elif kind == "cam_study":
+            channel = discord.utils.get(guild.voice_channels, name=self.cam_study_name)
+        else:
+            channel = None
+        self._channels[key] = channel
+        return channel
+
+    def tracked_voice_ids(self, guild):
+        ids = self._tracked.get(guild.id)
+        if ids is None:
+            self.resolves += 1
+            ids = self.get(guild.id).tracked_voice_ids()
+            if ids is None:
+                ids = frozenset(c.id for c in guild.voice_channels if c.name in self.tracked_voice_names)
+            self._tracked[guild.id] = ids
+        return ids
+
+    def is_tracked_voice(self, channel) -> bool:
+        return channel is not None and channel.id in self.tracked_voice_ids(channel.guild)
+
+    def is_cam_study(self, channel) -> bool:
+        if channel is None:
+            return False
+        cam = self.channel(channel.guild, "cam_study")
+        return cam is not None and cam.id == channel.id
+
+    async def set(self, guild_id, **values):
+        """설정을 저장하고 캐시에 바로 반영"""
+        await db.set_guild_config(str(guild_id), **values)
+        current = self.get(guild_id)
+        merged = {column: getattr(current, column) for column in db.GUILD_CONFIG_COLUMNS}
+        merged.update(values)
+        self._configs[int(guild_id)] = GuildConfig(**merged)
+        self.invalidate(guild_id)
+
+    def invalidate(self, guild_id):
+        """찾아 둔 채널만 버림 (설정 값은 그대로)"""
+        guild_id = int(guild_id)
+        for key in [key for key in self._channels if key[0] == guild_id]:
+            del self._channels[key]
+        self._tracked.pop(guild_id, None)
+
+    def stats(self):
+        return {"configured": len(self._configs), "channels": len(self._channels),
+                "voice_sets": len(self._tracked), "resolves": self.resolves}
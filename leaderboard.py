@@ -0,0 +1,58 @@
+import bisect
+
+class Leaderboard:
+    """서버 하나의 유저를 경험치 내림차순으로 정렬한 목록 (이벤트 루프 스레드에서만 사용)
+
+    _keys는 (-exp, user_id) 정렬 리스트라서 순위 조회는 이분 탐색 O(log n),
+    TOP N은 앞에서 N개를 자르기만 하면 됩니다. 갱신은 bisect로 위치를 찾아
+    리스트에서 빼고 넣는 방식이라 DB의 ORDER BY 전체 정렬보다 훨씬 가볍습니다.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._exp = {}
+        self._nicknames = {}
+
+    def load(self, rows):
+        """(user_id, nickname, exp) 목록으로 전체를 다시 채움"""
+        self._exp = {str(user_id): int(exp or 0) for user_id, _, exp in rows}
+        self._nicknames = {str(user_id): nickname for user_id, nickname, _ in rows}
+        self._keys = sorted((-exp, user_id) for user_id, exp in self._exp.items())
+
+    def _remove_key(self, user_id):
+        exp = self._exp.get(user_id)
+        if exp is None:
+            return
+        index = bisect.bisect_left(self._keys, (-exp, user_id))
+        if index < len(self._keys) and self._keys[index] == (-exp, user_id):
+            del self._keys[index]
+
+    def set(self, user_id, exp, nickname=None):
+        self._remove_key(user_id)
+        self._exp[user_id] = exp
+        bisect.insort(self._keys, (-exp, user_id))
+        if nickname is not None:
+            self._nicknames[user_id] = nickname
+
+    def add(self, user_id, amount, nickname=None):
+        new_exp = self._exp.get(user_id, 0) + amount
+        self.set(user_id, new_exp, nickname)
+        return new_exp
+
+    def touch(self, user_id, nickname):
+        """유저 등록/닉네임 변경 반영 (처음 보는 유저는 0 Exp로 추가)"""
+        if user_id not in self._exp:
+            self.set(user_id, 0, nickname)
+        else:
+            self._nicknames[user_id] = nickname
+
+    def top(self, limit=10):
+        """[(nickname, exp), ...] (get_top_users_by_exp와 같은 모양)"""
+        return [(self._nicknames.get(user_id), -neg_exp) for neg_exp, user_id in self._keys[:limit]]
+
+    def rank(self, user_id):
+        """(순위, 전체 인원). 모르는 유저면 None"""
+        exp = self._exp.get(user_id)
+        if exp is None:
+            return None
+        return bisect.bisect_left(self._keys, (-exp, user_id)) + 1, len(self._keys)
@@ -4,12 +4,22 @@ from discord.ui import View, Button
 from discord import app_commands
 from datetime import datetime, timedelta
 from pytz import timezone
+from typing import Union
 import db 
+from sheets import SheetOutbox
+from edit_queue import EditQueue
+from scheduler import JobScheduler
+from dispatcher import UserEventDispatcher
+from guild_config import GuildConfigCache
+import metrics
 import random
 import os
-import aiohttp
 import asyncio
 import logging
+import hashlib
+import json
+import time
+import re
 
 # ... (상단 설정은 기존과 동일)
 TOKEN = os.getenv("DISCORD_TOKEN")
@@ -19,27 +29,43 @@ intents.message_content = True
 intents.voice_states = True
 intents.messages = True
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+# 여러 서버를 한 프로세스에서 처리하도록 샤드 수는 Discord 권장값으로 자동 결정
+class JipsaBot(commands.AutoShardedBot):
+    async def close(self):
+        # 종료 전에 메모리에만 있던 시트 기록을 spool 테이블에 저장 (재시작 후 이어서 전송)
+        try:
+            await sheet_outbox.close()
+        except Exception as e:
+            logger.error(f"시트 전송 대기열 정리 중 오류: {e}")
+        await super().close()
+
+bot = JipsaBot(command_prefix="!", intents=intents)
+metrics.instrument_discord_http(bot.http)  # 계측이 꺼져 있으면 아무것도 하지 않음
 logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 logger = logging.getLogger(__name__)
 CAM_STUDY_CHANNEL = "🎥｜캠스터디"
 CAM_BONUS_MULTIPLIER = 2
+CAM_KICK_DELAY = 600  # 캠스터디 입장 후 카메라를 켜야 하는 시간(초)
+RANKING_REFRESH_INTERVAL = float(os.getenv("RANKING_REFRESH_INTERVAL", "30"))  # 랭킹 메시지 최소 수정 간격(초)
+BULK_NOTIFY_CONCURRENCY = int(os.getenv("BULK_NOTIFY_CONCURRENCY", "5"))  # 일괄 지급 후 동시에 처리할 알림 수
+VOICE_EVENT_CONCURRENCY = int(os.getenv("VOICE_EVENT_CONCURRENCY", "4"))  # 동시에 처리할 음성 이벤트 수 (유저 단위로는 항상 순서대로)
+
+# [수정] 시트 기록은 SheetOutbox가 모아서 백그라운드로 전송 (응답을 기다리지 않음)
+# GSHEET_BATCHED=1은 웹훅(Apps Script)이 "rows" 묶음 형태를 받도록 바꾼 뒤에만 켤 것
+sheet_outbox = SheetOutbox(GSHEET_WEBHOOK, batch_size=int(os.getenv("GSHEET_BATCH_SIZE", "20")),
+                           batched=os.getenv("GSHEET_BATCHED", "0") == "1")
+
+# [신규] 메시지 수정은 EditQueue를 거쳐 (채널, 메시지)별 최신 내용만 전송
+edit_queue = EditQueue()
 
-# ... (append_to_sheet, get_embed_footer, AttendanceRankingView, LEVELS 등 기존과 동일)
-async def append_to_sheet(session: aiohttp.ClientSession, sheet_name: str, data: list) -> bool:
+# ... (get_embed_footer, AttendanceRankingView, LEVELS 등 기존과 동일)
+def append_to_sheet(sheet_name: str, guild_id: str, data: list) -> bool:
     if not GSHEET_WEBHOOK:
         logger.error("Google Sheet Webhook URL이 설정되어 있지 않습니다.")
         return False
-    payload = {"sheet": sheet_name, "data": data}
-    try:
-        async with session.post(GSHEET_WEBHOOK, json=payload, timeout=10) as resp:
-            if resp.status != 200:
-                logger.warning(f"Google Sheet API 비정상 응답: 상태코드 {resp.status}")
-                return False
-            return True
-    except Exception as e:
-        logger.error(f"Google Sheet API 요청 실패: {str(e)}")
-        return False
+    # 여러 서버의 기록이 한 시트에 섞이므로 서버 ID를 마지막 열에 붙임 (기존 열 순서는 그대로)
+    sheet_outbox.append(sheet_name, [*data, guild_id])
+    return True
 
 def get_embed_footer(user: discord.User, dt: datetime):
     kst = timezone('Asia/Seoul')
@@ -57,6 +83,8 @@ class AttendanceRankingView(View):
         super().__init__(timeout=None)
         self.add_item(Button(label="🔥 연속 출석 랭킹", style=discord.ButtonStyle.primary, custom_id="streak_rank"))
         self.add_item(Button(label="📅 누적 출석 랭킹", style=discord.ButtonStyle.secondary, custom_id="total_rank"))
+        self.add_item(Button(label="📚 주간 공부 랭킹", style=discord.ButtonStyle.secondary, custom_id="weekly_study_rank"))
+        self.add_item(Button(label="☀️ 월간 기상 랭킹", style=discord.ButtonStyle.secondary, custom_id="monthly_wakeup_rank"))
 
 LEVELS = {
     1: {"emoji": "🪴", "name": "궁전문 앞 새싹", "desc": "드디어 궁전문을 똑똑 두드리는 우리 새싹 공듀🌱\n아직은 설렘과 긴장이 함께 찾아오지만,\n햇살이 좋은 날엔 ‘나도 뭔가 해낼 수 있을 것 같아’\n가만히 마음속 다짐이 싹 트기 시작해요."},
@@ -71,25 +99,35 @@ LEVELS = {
     10: {"emoji": "👑", "name": "QUEEN", "desc": "궁전의 왕좌에 앉은 우리 왕국의 QUEEN!\n어떤 하루도 멋지게 완성할 수 있다는 걸\n작은 실천들이 알려줬어요💖\n이제는 모두의 롤모델이 되어,\n다른 공듀들에게도 ‘나만의 갓생’을 응원할 수 있답니다.\n오늘도 함께라서 참 든든해요!"},
 }
 LEVEL_THRESHOLDS = [0, 200, 600, 1500, 3000, 5000, 7500, 10000, 14000, 18500, 25000]
+# 서버별 설정이 없을 때 이름으로 찾는 기본 채널
+STUDY_LOG_CHANNEL = "📕｜공부기록"
 TRACKED_VOICE_CHANNELS = ["🎥｜캠스터디", "📖｜1인실 (A)", "📖｜1인실 (B)", "📓｜도서관", "🌆｜워크스페이스"]
+# 여러 서버 지원 이전의 채널 ID: 기존 서버(LEGACY_GUILD_ID)의 guild_config를 처음 만들 때만 사용
 RANKING_CHANNEL_ID = 1378863730741219458
 HONOR_CHANNEL_ID = 1378863861863682102
 MYINFO_CHANNEL_ID = 1378952514702938182
 ATTENDANCE_CHANNEL_ID = 1378862713484218489
 WAKEUP_CHANNEL_ID = 1378862771214745690
-ranking_message_id = None
-user_info_channel_msgs = {}
+LEGACY_CHANNELS = {
+    "ranking_channel_id": RANKING_CHANNEL_ID,
+    "honor_channel_id": HONOR_CHANNEL_ID,
+    "myinfo_channel_id": MYINFO_CHANNEL_ID,
+    "attendance_channel_id": ATTENDANCE_CHANNEL_ID,
+    "wakeup_channel_id": WAKEUP_CHANNEL_ID,
+}
+guild_configs = GuildConfigCache(STUDY_LOG_CHANNEL, TRACKED_VOICE_CHANNELS, CAM_STUDY_CHANNEL)
+ranking_message_ids = {}  # guild_id -> 랭킹 메시지 ID
 
 def get_level_from_exp(exp):
     for i in range(1, len(LEVEL_THRESHOLDS)):
         if exp < LEVEL_THRESHOLDS[i]: return i
     return 10
 
-async def get_user_exp(user_id):
-    return await db.get_exp(str(user_id))
+async def get_user_exp(guild_id, user_id):
+    return await db.get_exp(str(guild_id), str(user_id))
 
 async def send_levelup_embed(member, new_level):
-    honor_channel = bot.get_channel(HONOR_CHANNEL_ID)
+    honor_channel = guild_configs.channel(member.guild, "honor")
     if honor_channel is None: return
     data = LEVELS[new_level]
     embed = discord.Embed(
@@ -102,8 +140,9 @@ async def send_levelup_embed(member, new_level):
     await honor_channel.send(embed=embed)
 
 async def create_or_update_user_info(member):
+    guild_id = str(member.guild.id)
     user_id = str(member.id)
-    exp = await get_user_exp(user_id)
+    exp = await get_user_exp(guild_id, user_id)
     level = get_level_from_exp(exp)
     leveldata = LEVELS[level]
     if level < len(LEVEL_THRESHOLDS) - 1: next_exp = LEVEL_THRESHOLDS[level]
@@ -129,14 +168,18 @@ async def create_or_update_user_info(member):
     )
     embed.add_field(name="👑 레벨", value=f"{leveldata['emoji']} Lv.{level} {leveldata['name']}", inline=False)
     embed.add_field(name="📊 총 경험치", value=f"{exp} Exp (다음 레벨까지 {exp_required} Exp 남음)", inline=False)
+    rank = await db.get_user_rank(guild_id, user_id)
+    if rank:
+        embed.add_field(name="🏅 경험치 순위", value=f"{rank[0]}위 / {rank[1]}명", inline=False)
     embed.add_field(name="📈 진행도", value=f"`{bar}`", inline=False)
-    stats_month = await db.get_monthly_stats(user_id)
+    stats = await db.get_user_stats_snapshot(guild_id, user_id)
+    stats_month = stats["month"]
     embed.add_field(
         name="📅 이번달 통계",
         value=(f"출석: {stats_month['attendance']}일\n기상: {stats_month['wakeup']}일\n공부일수: {stats_month['study_days']}일\n공부시간: {stats_month['study_minutes']}분"),
         inline=True
     )
-    stats_week = await db.get_weekly_stats(user_id)
+    stats_week = stats["week"]
     embed.add_field(
         name="📆 이번주 통계",
         value=(f"출석: {stats_week['attendance']}일\n기상: {stats_week['wakeup']}일\n공부일수: {stats_week['study_days']}일\n공부시간: {stats_week['study_minutes']}분"),
@@ -144,45 +187,86 @@ async def create_or_update_user_info(member):
     )
     footer = get_embed_footer(member, now)
     embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
-    channel = bot.get_channel(MYINFO_CHANNEL_ID)
+    channel = guild_configs.channel(member.guild, "myinfo")
     if channel is None: return
-    if user_id in user_info_channel_msgs:
-        try:
-            msg_id = user_info_channel_msgs[user_id]
-            existing = await channel.fetch_message(msg_id)
-            await existing.edit(embed=embed)
-            return
-        except Exception:
-            user_info_channel_msgs.pop(user_id, None)
-    new_msg = await channel.send(embed=embed)
-    user_info_channel_msgs[user_id] = new_msg.id
+
+    async def send_new():
+        new_msg = await channel.send(embed=embed)
+        await db.set_message_ref(guild_id, "myinfo", user_id, channel.id, new_msg.id)
+
+    ref = await db.get_message_ref(guild_id, "myinfo", user_id)
+    if ref and ref[0] in (None, channel.id):
+        # fetch 없이 바로 수정하고, 기존 메시지가 지워졌으면 그때만 새로 보냄
+        edit_queue.submit(channel, ref[1], embed=embed, on_missing=send_new)
+        return
+    await send_new()
 
 # ====================================================================================
 # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
 # [수정] add_exp_and_check_level: 랭킹 업데이트 호출 추가
 # ====================================================================================
 async def add_exp_and_check_level(member, exp_gained):
+    guild_id = str(member.guild.id)
     user_id = str(member.id)
-    exp_before = await get_user_exp(user_id)
+    exp_before, exp_after = await db.grant_exp(guild_id, user_id, member.display_name, exp_gained)
     old_level = get_level_from_exp(exp_before)
-    await db.add_exp(user_id, member.display_name, exp_gained)
-    exp_after = exp_before + exp_gained
     new_level = get_level_from_exp(exp_after)
     if new_level > old_level:
         await send_levelup_embed(member, new_level)
-    async with aiohttp.ClientSession() as session:
-        await append_to_sheet(session, "users", [user_id, member.display_name, exp_after, new_level])
+    append_to_sheet("users", guild_id, [user_id, member.display_name, exp_after, new_level])
     await create_or_update_user_info(member)
     
-    # 경험치 변경이 완료된 후, 랭킹 업데이트 함수를 직접 호출!
-    await update_ranking()
+    # 경험치 변경이 완료되면 랭킹 갱신 예약 (실제 수정은 RankingRefresher가 모아서 처리)
+    ranking_refresher.mark_dirty(guild_id)
     
     return new_level, exp_after
 
-async def make_ranking_embed():
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 일괄 경험치 지급: DB는 트랜잭션 한 번, 레벨업/내정보 갱신은 동시성 제한 큐로 처리
+# ====================================================================================
+async def _run_bounded(jobs, handler, concurrency):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            try:
+                await handler(*job)
+            except Exception as e:
+                logger.error(f"일괄 처리 작업 중 오류: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(jobs)))))
+
+async def grant_exp_to_members(guild, members, amount):
+    """guild의 여러 멤버에게 amount씩 한 번에 지급하고 [(member, 이후 exp, 레벨업했으면 새 레벨 아니면 None), ...] 반환"""
+    results = await db.grant_exp_bulk(str(guild.id), [(str(m.id), m.display_name, amount) for m in members])
+    members_by_id = {str(m.id): m for m in members}
+    grants = []
+    for user_id, exp_before, exp_after in results:
+        member = members_by_id[user_id]
+        new_level = get_level_from_exp(exp_after)
+        append_to_sheet("users", str(guild.id), [user_id, member.display_name, exp_after, new_level])
+        grants.append((member, exp_after, new_level if new_level > get_level_from_exp(exp_before) else None))
+    return grants
+
+async def notify_bulk_grants(guild, grants):
+    """레벨업 알림과 내정보 갱신을 BULK_NOTIFY_CONCURRENCY개씩 처리하고, 랭킹은 마지막에 한 번만 갱신"""
+    async def notify(member, exp_after, new_level):
+        if new_level:
+            await send_levelup_embed(member, new_level)
+        await create_or_update_user_info(member)
+
+    await _run_bounded(grants, notify, BULK_NOTIFY_CONCURRENCY)
+    ranking_refresher.mark_dirty(str(guild.id))
+
+async def make_ranking_embed(guild_id, ranking=None):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일 %H:%M 기준")
-    ranking = await db.get_top_users_by_exp()
+    if ranking is None:
+        ranking = await db.get_top_users_by_exp(guild_id)
     embed = discord.Embed(title="🏆 경험치 랭킹 TOP 10", color=discord.Color.gold())
     if not ranking:
         embed.description = "아직 아무도 경험치를 쌓지 않았어요! 🌱"
@@ -200,121 +284,330 @@ async def make_ranking_embed():
 # ====================================================================================
 # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
 # [수정] update_ranking: 더 이상 tasks.loop가 아님
+# - 서버마다 자기 랭킹 채널의 메시지를 수정
 # ====================================================================================
-async def update_ranking():
-    """경험치 순위가 변경될 때마다 호출되는 함수"""
-    global ranking_message_id
-    channel = bot.get_channel(RANKING_CHANNEL_ID)
-    if channel is None: return
-    if ranking_message_id is None:
+async def update_ranking(guild, ranking=None):
+    """guild의 랭킹 메시지를 수정하는 함수 (보통은 RankingRefresher를 통해 호출)"""
+    guild_id = str(guild.id)
+    channel = guild_configs.channel(guild, "ranking")
+    if channel is None: return False
+    if guild_id not in ranking_message_ids:
         # 랭킹 메시지가 없는 경우, 먼저 설정
-        await setup_ranking_message()
-        if ranking_message_id is None: return
-    try:
-        msg = await channel.fetch_message(ranking_message_id)
-        embed = await make_ranking_embed()
-        await msg.edit(embed=embed)
-    except discord.NotFound:
+        await setup_ranking_message(guild)
+        if guild_id not in ranking_message_ids: return False
+
+    async def recreate():
         # 메시지가 삭제된 경우, ID를 초기화하고 새로 생성
-        ranking_message_id = None
-        await setup_ranking_message()
+        ranking_message_ids.pop(guild_id, None)
+        await setup_ranking_message(guild, reuse_saved=False)
+        if guild_id not in ranking_message_ids:
+            raise RuntimeError("랭킹 메시지를 새로 만들지 못했습니다.")
+
+    try:
+        embed = await make_ranking_embed(guild_id, ranking)
     except Exception as e:
         logger.error(f"랭킹 업데이트 중 오류: {e}")
+        return False
+    return await edit_queue.submit(channel, ranking_message_ids[guild_id], embed=embed, on_missing=recreate)
 
-@bot.event
-async def on_ready():
-    await db.initialize_database()
-    bot.add_view(AttendanceRankingView())
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] RankingRefresher: 경험치가 바뀔 때마다 바로 수정하지 않고 모아서 갱신
+# - 요청이 아무리 많아도 interval마다 서버당 최대 한 번만 메시지를 수정
+# - 바뀐 서버만 모아 두고, TOP 10이 그대로면 수정 자체를 건너뜀
+# ====================================================================================
+class RankingRefresher:
+    def __init__(self, interval):
+        self.interval = interval
+        self._dirty = asyncio.Event()
+        self._guilds = set()
+        self._task = None
+        self._last_rankings = {}  # guild_id -> 마지막으로 반영한 TOP 10
+
+    def mark_dirty(self, guild_id, force=False):
+        """guild_id의 랭킹이 바뀌었을 수 있음을 알림 (기다리지 않고 바로 반환)
+
+        force=True면 TOP 10이 그대로여도 다시 반영 (랭킹 채널을 바꿨을 때 등)
+        """
+        guild_id = str(guild_id)
+        if force:
+            self._last_rankings.pop(guild_id, None)
+        self._guilds.add(guild_id)
+        self._dirty.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            guilds, self._guilds = self._guilds, set()
+            for guild_id in guilds:
+                try:
+                    await self.refresh(guild_id)
+                except Exception as e:
+                    logger.error(f"랭킹 자동 갱신 중 오류 (서버 {guild_id}): {e}")
+            # 그 사이에 들어온 요청은 다음 한 번의 갱신으로 합쳐짐
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self, guild_id):
+        guild = bot.get_guild(int(guild_id))
+        if guild is None:
+            return
+        ranking = await db.get_top_users_by_exp(guild_id)
+        snapshot = [tuple(row) for row in ranking]
+        if snapshot == self._last_rankings.get(guild_id):
+            return
+        if await update_ranking(guild, ranking):
+            self._last_rankings[guild_id] = snapshot
+
+ranking_refresher = RankingRefresher(RANKING_REFRESH_INTERVAL)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] on_ready: 게이트웨이 재연결마다 다시 불려도 시작 작업은 프로세스당 한 번만
+# - DB 스키마는 버전 확인 쿼리 한 번, 명령어 트리는 해시가 바뀌었을 때만 sync
+# - 랭킹 메시지 ID는 message_index에 저장해 두고 채널 기록을 뒤지지 않음
+# - 단계별 소요 시간을 로그로 남김
+# - 여러 서버 지원 이전 기록은 처음 한 번 기존 서버(LEGACY_GUILD_ID 또는 유일한 서버)로 배정
+# ====================================================================================
+_startup_started = False
+
+def command_tree_hash():
+    payload = [command.to_dict() for command in sorted(bot.tree.get_commands(), key=lambda c: c.name)]
+    raw = json.dumps([bot.application_id, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def sync_command_tree():
+    tree_hash = command_tree_hash()
+    if await db.get_bot_state("command_tree_hash") == tree_hash:
+        return False
     await bot.tree.sync()
+    await db.set_bot_state("command_tree_hash", tree_hash)
+    return True
+
+_MENTION = re.compile(r"<@!?(\d+)>")
+
+async def adopt_legacy_guild():
+    """guild_id가 없던 시절의 기록과 채널 ID를 한 서버에 배정하고 그 서버를 반환 (이미 했으면 그 서버)"""
+    saved = await db.get_bot_state("legacy_guild_id")
+    if saved is not None:
+        return bot.get_guild(int(saved)) if saved else None
+    guild_id = db.LEGACY_GUILD_ID or (str(bot.guilds[0].id) if len(bot.guilds) == 1 else "")
+    if not guild_id:
+        if await db.count_unassigned_rows():
+            logger.warning("이전 기록을 배정할 서버를 정할 수 없습니다. LEGACY_GUILD_ID를 설정해주세요.")
+            return None
+        # 배정할 기록이 없으면 새로 설치한 것이므로 다시 확인하지 않음
+        await db.set_bot_state("legacy_guild_id", "")
+        return None
+    try:
+        moved = await db.assign_legacy_guild(guild_id)
+    except Exception as e:
+        # 실패해도 봇은 계속 시작 (legacy_guild_id를 저장하지 않으므로 다음 시작 때 다시 시도)
+        logger.error(f"이전 기록을 서버 {guild_id}에 배정하지 못했습니다: {e}")
+        return None
+    guild = bot.get_guild(int(guild_id))
+    if guild is not None and not guild_configs.is_configured(guild.id):
+        # 코드에 박혀 있던 채널 중 이 서버에 실제로 있는 것만 설정으로 옮김
+        seed = {column: channel_id for column, channel_id in LEGACY_CHANNELS.items() if guild.get_channel(channel_id)}
+        if seed:
+            await guild_configs.set(guild.id, **seed)
+    await db.set_bot_state("legacy_guild_id", guild_id)
+    if moved:
+        logger.info(f"이전 기록 {moved}행을 서버 {guild_id}에 배정")
+    return guild
+
+async def backfill_message_index(guild):
+    """내정보 채널을 한 번 훑어서 이전 버전이 남긴 메시지를 message_index에 등록 (완료하면 다시 하지 않음)"""
+    if guild is None or await db.get_bot_state("message_index_backfilled"):
+        return 0
+    guild_id = str(guild.id)
+    channel = guild_configs.channel(guild, "myinfo")
+    if channel is None:
+        return 0
+    rows = {}
+    stale = 0
+    # 최신 메시지부터 오므로 유저마다 처음 본 것이 가장 최근 메시지
+    async for msg in channel.history(limit=None):
+        if msg.author != bot.user or not msg.embeds:
+            continue
+        embed = msg.embeds[0]
+        if not (embed.title and embed.title.endswith("님의 내정보") and embed.description):
+            continue
+        match = _MENTION.search(embed.description)
+        if match is None:
+            continue
+        if match.group(1) in rows:
+            stale += 1
+            continue
+        rows[match.group(1)] = (guild_id, "myinfo", match.group(1), channel.id, msg.id)
+    added = await db.add_message_refs(list(rows.values()))
+    await db.set_bot_state("message_index_backfilled", "1")
+    logger.info(f"내정보 메시지 {added}개 등록 (지난 중복 메시지 {stale}개는 그대로 둠)")
+    return added
+
+async def run_startup():
+    timings = []
+
+    async def phase(name, coro):
+        started = time.perf_counter()
+        result = await coro
+        timings.append(f"{name} {(time.perf_counter() - started) * 1000:.0f}ms")
+        return result
+
+    await phase("db", db.initialize_database())
+    await phase("guild_config", guild_configs.load())
+    legacy_guild = await phase("legacy_guild", adopt_legacy_guild())
+    await phase("leaderboard", db.load_leaderboard())
+    await phase("sessions", db.load_study_sessions())
+    await phase("message_index", backfill_message_index(legacy_guild))
+    bot.add_view(AttendanceRankingView())
+    synced = await phase("command_sync", sync_command_tree())
     # [삭제] 더 이상 1분마다 업데이트하지 않음
     # update_ranking.start() 
-    await setup_ranking_message()
-    print(f"✅ {bot.user} 로그인 완료")
+    # 랭킹 메시지는 서버마다 RankingRefresher의 첫 갱신에서 준비 (on_ready에서 전부 mark_dirty)
+    ranking_refresher.start()
+    await phase("scheduler", job_scheduler.start())
+    if GSHEET_WEBHOOK:
+        sheet_outbox.start()
+    await phase("metrics", metrics.start())
+    logger.info(f"시작 작업 완료 (명령어 sync {'함' if synced else '생략'}): {', '.join(timings)}")
 
-async def setup_ranking_message():
-    global ranking_message_id
-    channel = bot.get_channel(RANKING_CHANNEL_ID)
-    if channel is None: return
-    async for msg in channel.history(limit=20):
-        if (msg.author == bot.user and msg.embeds and msg.embeds[0].title and "경험치 랭킹" in msg.embeds[0].title):
-            ranking_message_id = msg.id
-            break
+@bot.event
+async def on_ready():
+    global _startup_started
+    if _startup_started:
+        logger.info("게이트웨이 재연결: 시작 작업은 건너뜀")
     else:
-        embed = await make_ranking_embed()
-        msg = await channel.send(embed=embed)
-        await msg.pin()
-        ranking_message_id = msg.id
+        _startup_started = True
+        try:
+            await run_startup()
+        except Exception:
+            _startup_started = False  # 다음 on_ready에서 다시 시도
+            raise
+    for guild in bot.guilds:
+        ranking_refresher.mark_dirty(guild.id)  # 오프라인 동안 바뀐 랭킹 반영
+    print(f"✅ {bot.user} 로그인 완료 (서버 {len(bot.guilds)}개, 샤드 {bot.shard_count}개)")
 
-async def check_and_kick(member: discord.Member):
-    await asyncio.sleep(600)
-    user_id = str(member.id)
-    if not member.guild or not member.voice or member.voice.channel.name != CAM_STUDY_CHANNEL:
+async def setup_ranking_message(guild, reuse_saved=True):
+    guild_id = str(guild.id)
+    channel = guild_configs.channel(guild, "ranking")
+    if channel is None: return
+    if reuse_saved:
+        ref = await db.get_message_ref(guild_id, "ranking")
+        if ref and ref[0] in (None, channel.id):
+            ranking_message_ids[guild_id] = ref[1]
+            return
+        # 저장된 ID가 없을 때(이전 버전에서 올라온 경우)만 기존 메시지를 찾아봄
+        async for msg in channel.history(limit=20):
+            if (msg.author == bot.user and msg.embeds and msg.embeds[0].title and "경험치 랭킹" in msg.embeds[0].title):
+                ranking_message_ids[guild_id] = msg.id
+                await db.set_message_ref(guild_id, "ranking", "", channel.id, msg.id)
+                return
+    embed = await make_ranking_embed(guild_id)
+    msg = await channel.send(embed=embed)
+    await msg.pin()
+    ranking_message_ids[guild_id] = msg.id
+    await db.set_message_ref(guild_id, "ranking", "", channel.id, msg.id)
+
+def make_study_status_embed(member, session, title, description, color):
+    """공부 입장 메시지를 다시 그림 (기존 메시지를 fetch하지 않도록 footer는 입장 시각 기준)"""
+    embed = discord.Embed(title=title, description=description, color=color)
+    footer = get_embed_footer(member, session['start'])
+    embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
+    return embed
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] check_and_kick: 멤버마다 sleep하는 태스크 대신 JobScheduler의 "cam_kick" 작업으로 실행
+# - 재입장하면 예약이 새로 덮어써지고, 재시작해도 scheduled_jobs에서 이어서 실행
+# ====================================================================================
+job_scheduler = JobScheduler()
+
+@metrics.timed("handler", "cam_kick")
+async def check_and_kick(guild_id: str, user_id: str, payload):
+    guild = bot.get_guild(int(guild_id)) if guild_id else None
+    member = guild.get_member(int(user_id)) if guild else None
+    if member is None:
+        return
+    if not member.voice or not guild_configs.is_cam_study(member.voice.channel):
         return
-    session = await db.get_study_session(user_id)
+    session = await db.get_study_session(guild_id, user_id)
     if not session or session.get('multiplier', 1) != 1:
         return
+    # 강퇴로 생기는 퇴장 이벤트는 디스패처에서 따로 처리되므로, 세션을 먼저 지워서
+    # 그 이벤트가 end_study_session에서 아무것도 꺼내지 못하게 함 (규칙 위반 세션에 경험치 지급 방지)
+    await db.delete_study_session(guild_id, user_id)
     try:
-        study_channel = discord.utils.get(member.guild.text_channels, name="📕｜공부기록")
+        study_channel = guild_configs.channel(guild, "study_log")
         if study_channel:
-            msg = await study_channel.fetch_message(session['msg_id'])
-            embed = msg.embeds[0]
-            embed.title = "🚫 캠스터디 규칙 위반"
-            embed.description = f"{member.mention} 공듀님, 10분 내에 카메라를 켜지 않아 채널에서 이동되었어요."
-            embed.color = discord.Color.red()
-            await msg.edit(embed=embed)
+            embed = make_study_status_embed(
+                member, session, "🚫 캠스터디 규칙 위반",
+                f"{member.mention} 공듀님, 10분 내에 카메라를 켜지 않아 채널에서 이동되었어요.",
+                discord.Color.red()
+            )
+            edit_queue.submit(study_channel, session['msg_id'], embed=embed)
         await member.move_to(None, reason="캠스터디 10분 내 카메라 미사용")
     except Exception as e:
         logger.error(f"{member.display_name}님 강퇴 처리 중 오류: {e}")
-    finally:
-        await db.delete_study_session(user_id)
 
-@bot.event
-async def on_voice_state_update(member, before, after):
-    now_kst = datetime.now(timezone('Asia/Seoul'))
+job_scheduler.register("cam_kick", check_and_kick)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] 음성 이벤트: 유저별로 순서대로 처리 (빠른 퇴장→재입장, 퇴장 중 카메라 전환이 섞이지 않게)
+# - 이벤트 시각은 들어온 순간에 기록해서 대기 시간이 공부 시간에 섞이지 않음
+# - 공부기록 채널과 공부 음성 채널은 GuildConfigCache에서 바로 꺼냄 (채널 목록을 훑지 않음)
+# ====================================================================================
+@metrics.timed("handler", "on_voice_state_update")
+async def handle_voice_state_update(member, before, after, now_kst):
+    guild_id = str(member.guild.id)
     user_id = str(member.id)
-    study_channel = discord.utils.get(member.guild.text_channels, name="📕｜공부기록")
+    study_channel = guild_configs.channel(member.guild, "study_log")
     if study_channel is None: return
-    before_channel_name = before.channel.name if before.channel else None
-    after_channel_name = after.channel.name if after.channel else None
-    is_before_study = before_channel_name in TRACKED_VOICE_CHANNELS
-    is_after_study = after_channel_name in TRACKED_VOICE_CHANNELS
+    is_after_cam = guild_configs.is_cam_study(after.channel)
+    # 캠스터디 채널은 공부 음성 채널 목록에 없어도 공부 채널로 취급
+    is_before_study = guild_configs.is_tracked_voice(before.channel) or guild_configs.is_cam_study(before.channel)
+    is_after_study = guild_configs.is_tracked_voice(after.channel) or is_after_cam
     if is_after_study and not is_before_study:
         footer = get_embed_footer(member, now_kst)
-        if after_channel_name == CAM_STUDY_CHANNEL:
+        if is_after_cam:
             embed = discord.Embed(title="📸 캠스터디 입장!", color=member.color)
             embed.description = (f"{member.mention} 공듀님, 캠스터디에 오신 것을 환영해요!\n\n"
                                f"**10분 내에 카메라나 화면 공유를 켜주세요.**\n"
                                f"규칙을 지키지 않으면 자동으로 채널에서 내보내져요! 😥")
             embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
             msg = await study_channel.send(embed=embed)
-            await db.start_study_session(user_id, now_kst, msg.id)
-            bot.loop.create_task(check_and_kick(member))
+            await db.start_study_session(guild_id, user_id, now_kst, msg.id)
+            await job_scheduler.schedule("cam_kick", guild_id, user_id, CAM_KICK_DELAY)
         else:
             embed = discord.Embed(title="🎀 공듀 스터디룸 입장 🎀", color=member.color)
             embed.description = (f"{member.mention} 공듀님이 도서관에 나타났어요!\n"
                                f"오늘도 집중모드 발동✨\n공부 시작 시간: {now_kst.strftime('%H:%M:%S')}")
             embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
             msg = await study_channel.send(embed=embed)
-            await db.start_study_session(user_id, now_kst, msg.id)
+            await db.start_study_session(guild_id, user_id, now_kst, msg.id)
     elif is_before_study and not is_after_study:
-        session = await db.end_study_session(user_id)
+        await job_scheduler.cancel("cam_kick", guild_id, user_id)
+        session = await db.end_study_session(guild_id, user_id)
         if not session: return
         end_time = now_kst
         duration_minutes = (end_time - session['start']).total_seconds() / 60
-        try: msg = await study_channel.fetch_message(session['msg_id'])
-        except Exception: msg = None
         if duration_minutes < 10:
             embed = discord.Embed(title="⏰ 집중 실패! (10분 미만)", description=f"{member.mention} 공듀님, 10분 미만은 집중 인정 불가에요!", color=member.color)
             embed.set_footer(text=get_embed_footer(member, end_time)["text"], icon_url=get_embed_footer(member, end_time)["icon_url"])
-            if msg: await msg.edit(embed=embed)
+            edit_queue.submit(study_channel, session['msg_id'], embed=embed)
             return
         duration_int = int(duration_minutes)
         multiplier = session.get('multiplier', 1)
         exp_gained = duration_int * multiplier
-        await db.log_study_time(user_id, member.display_name, duration_int)
+        await db.log_study_time(guild_id, user_id, member.display_name, duration_int)
         level, exp_after = await add_exp_and_check_level(member, exp_gained)
         leveldata = LEVELS[level]
-        today_total = await db.get_today_study_time(user_id)
+        today_total = await db.get_today_study_time(guild_id, user_id)
         h, m = divmod(duration_int, 60)
         time_str = f"{h}시간 {m}분" if h else f"{m}분"
         embed = discord.Embed(title=f"{leveldata['emoji']} 집중 완료! 공듀 퇴장 ✨", description=f"{member.mention} 공듀님 오늘도 대단해요!\n공부박스 도착🎁", color=member.color)
@@ -323,38 +616,76 @@ async def on_voice_state_update(member, before, after):
         embed.add_field(name="👑 오늘 누적", value=f"**{today_total}분**", inline=True)
         embed.add_field(name="🏅 현재 레벨", value=f"{leveldata['emoji']} Lv.{level} {leveldata['name']}", inline=False)
         embed.set_footer(text=get_embed_footer(member, end_time)["text"], icon_url=get_embed_footer(member, end_time)["icon_url"])
-        if msg: await msg.edit(embed=embed)
-        else: await study_channel.send(embed=embed)
-    elif is_after_study and after_channel_name == CAM_STUDY_CHANNEL:
-        session = await db.get_study_session(user_id)
+        # 입장 메시지가 지워졌으면 새로 보냄
+        async def send_new():
+            await study_channel.send(embed=embed)
+        edit_queue.submit(study_channel, session['msg_id'], embed=embed, on_missing=send_new)
+    elif is_after_cam:
+        session = await db.get_study_session(guild_id, user_id)
         if not session: return
         is_cam_on = after.self_video or after.self_stream
         current_multiplier = session.get('multiplier', 1)
         try:
-            msg = await study_channel.fetch_message(session['msg_id'])
-            embed = msg.embeds[0]
+            # 카메라를 빠르게 껐다 켜도 EditQueue가 마지막 상태만 메시지에 반영
             if is_cam_on and current_multiplier == 1:
-                await db.update_study_multiplier(user_id, CAM_BONUS_MULTIPLIER)
-                embed.title = "열공 모드 ON 🔥"
-                embed.description = f"{member.mention} 공듀님, 집중하는 모습이 멋져요!\n**지금부터 경험치가 2배로 적용됩니다!**"
-                embed.color = discord.Color.green()
-                await msg.edit(embed=embed)
+                await db.update_study_multiplier(guild_id, user_id, CAM_BONUS_MULTIPLIER)
+                embed = make_study_status_embed(
+                    member, session, "열공 모드 ON 🔥",
+                    f"{member.mention} 공듀님, 집중하는 모습이 멋져요!\n**지금부터 경험치가 2배로 적용됩니다!**",
+                    discord.Color.green()
+                )
+                edit_queue.submit(study_channel, session['msg_id'], embed=embed)
             elif not is_cam_on and current_multiplier > 1:
-                await db.update_study_multiplier(user_id, 1)
-                embed.title = "📸 캠스터디 (일반 모드)"
-                embed.description = f"{member.mention} 공듀님, 휴식이 필요하신가요?\n카메라나 화면 공유를 다시 켜면 경험치 2배가 적용돼요!"
-                embed.color = member.color
-                await msg.edit(embed=embed)
+                await db.update_study_multiplier(guild_id, user_id, 1)
+                embed = make_study_status_embed(
+                    member, session, "📸 캠스터디 (일반 모드)",
+                    f"{member.mention} 공듀님, 휴식이 필요하신가요?\n카메라나 화면 공유를 다시 켜면 경험치 2배가 적용돼요!",
+                    member.color
+                )
+                edit_queue.submit(study_channel, session['msg_id'], embed=embed)
         except Exception as e:
             logger.error(f"캠스터디 상태 업데이트 중 오류: {e}")
 
+voice_dispatcher = UserEventDispatcher(handle_voice_state_update, concurrency=VOICE_EVENT_CONCURRENCY)
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    now_kst = datetime.now(timezone('Asia/Seoul'))
+    voice_dispatcher.submit((member.guild.id, member.id), member, before, after, now_kst)
+
+# [신규] 닉네임이 바뀌면 유저 등록 캐시를 비워서 다음 기록 때 새 닉네임이 저장되게 함
+@bot.event
+async def on_member_update(before, after):
+    if before.display_name != after.display_name:
+        db.forget_user(str(after.id), str(after.guild.id))
+
+@bot.event
+async def on_user_update(before, after):
+    if before.display_name != after.display_name:
+        db.forget_user(str(after.id))
+
+# [신규] 채널이 바뀌면 그 서버에서 찾아 둔 채널만 다시 찾게 함
+@bot.event
+async def on_guild_channel_create(channel):
+    guild_configs.invalidate(channel.guild.id)
+
 @bot.event
+async def on_guild_channel_delete(channel):
+    guild_configs.invalidate(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name:
+        guild_configs.invalidate(after.guild.id)
+
+@bot.event
+@metrics.timed("handler")
 async def on_message(message):
-    if message.author.bot:
+    if message.author.bot or message.guild is None:
         return
     if not message.content.startswith(bot.command_prefix) and message.attachments:
         user_id = str(message.author.id)
-        pending_msg_id = await db.get_and_remove_wakeup_pending(user_id)
+        pending_msg_id = await db.get_and_remove_wakeup_pending(str(message.guild.id), user_id)
         if pending_msg_id:
             try:
                 req_msg = await message.channel.fetch_message(pending_msg_id)
@@ -383,14 +714,14 @@ async def on_message(message):
 
 # ... (이하 !출석, !기상, !통계, !기록, !명령어, 슬래시 커맨드 등 기존 코드와 동일)
 @bot.command(name="출석")
+@metrics.timed("handler", "!출석")
 async def checkin(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
-    saved_db = await db.save_attendance(str(ctx.author.id), ctx.author.display_name)
-    async with aiohttp.ClientSession() as session:
-        await append_to_sheet(session, "attendance", [str(ctx.author.id), now.strftime("%Y-%m-%d"), ctx.author.display_name])
-    streak = await db.get_streak_attendance(str(ctx.author.id))
-    attendance_rows = await db.get_attendance(str(ctx.author.id))
-    total = len(attendance_rows) if attendance_rows else 0
+    guild_id = str(ctx.guild.id)
+    saved_db = await db.save_attendance(guild_id, str(ctx.author.id), ctx.author.display_name)
+    append_to_sheet("attendance", guild_id, [str(ctx.author.id), now.strftime("%Y-%m-%d"), ctx.author.display_name])
+    streak = await db.get_streak_attendance(guild_id, str(ctx.author.id))
+    total = await db.count_history(guild_id, "attendance", str(ctx.author.id))
     embed = discord.Embed(color=ctx.author.color)
     if not saved_db:
         embed.title = "👑 출석 실패"
@@ -409,107 +740,218 @@ async def checkin(ctx):
     await ctx.send(embed=embed, view=AttendanceRankingView())
 
 @bot.event
+@metrics.timed("handler")
 async def on_interaction(interaction: discord.Interaction):
     if not interaction.data or "custom_id" not in interaction.data: return
+    if interaction.guild is None: return
+    guild_id = str(interaction.guild.id)
     custom_id = interaction.data.get("custom_id")
     if custom_id == "streak_rank":
-        top_users = await db.get_streak_rankings()
+        top_users = await db.get_streak_rankings(guild_id)
         description = ""
         for i, user_data in enumerate(top_users, start=1):
             description += f"{i}위 🔥 **{user_data['nickname']}** — {user_data['streak']}일\n"
         embed = discord.Embed(title="🔥 연속 출석 랭킹 TOP 10", description=description or "출석 기록이 없습니다.", color=discord.Color.orange())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif custom_id == "total_rank":
-        top_users = await db.get_total_attendance_rankings()
+        top_users = await db.get_total_attendance_rankings(guild_id)
         description = ""
         for i, user_data in enumerate(top_users, start=1):
             description += f"{i}위 📅 **{user_data['nickname']}** — {user_data['count']}회\n"
         embed = discord.Embed(title="📅 누적 출석 랭킹 TOP 10", description=description or "출석 기록이 없습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
+    elif custom_id == "weekly_study_rank":
+        top_users = await db.get_weekly_study_rankings(guild_id)
+        description = ""
+        for i, user_data in enumerate(top_users, start=1):
+            h, m = divmod(user_data['minutes'], 60)
+            time_str = f"{h}시간 {m}분" if h else f"{m}분"
+            description += f"{i}위 📚 **{user_data['nickname']}** — {time_str}\n"
+        embed = discord.Embed(title="📚 이번주 공부 시간 랭킹 TOP 10", description=description or "이번주 공부 기록이 없습니다.", color=discord.Color.blue())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    elif custom_id == "monthly_wakeup_rank":
+        top_users = await db.get_monthly_wakeup_rankings(guild_id)
+        description = ""
+        for i, user_data in enumerate(top_users, start=1):
+            description += f"{i}위 ☀️ **{user_data['nickname']}** — {user_data['count']}회\n"
+        embed = discord.Embed(title="☀️ 이번달 기상 랭킹 TOP 10", description=description or "이번달 기상 기록이 없습니다.", color=discord.Color.gold())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.command(name="기상")
+@metrics.timed("handler", "!기상")
 async def wakeup(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
+    guild_id = str(ctx.guild.id)
     user_id = str(ctx.author.id)
-    is_first_wakeup = await db.save_wakeup(user_id, ctx.author.display_name) 
+    is_first_wakeup = await db.save_wakeup(guild_id, user_id, ctx.author.display_name) 
     footer = get_embed_footer(ctx.author, now)
     if not is_first_wakeup:
         embed = discord.Embed(title="☀️ 기상 실패", description=f"{ctx.author.mention} 공듀님, 오늘은 이미 기상 인증했어요! ☀️", color=ctx.author.color)
         embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
         await ctx.send(embed=embed)
         return
-    async with aiohttp.ClientSession() as session:
-        await append_to_sheet(session, "wakeup", [user_id, now.strftime("%Y-%m-%d"), ctx.author.display_name])
+    append_to_sheet("wakeup", guild_id, [user_id, now.strftime("%Y-%m-%d"), ctx.author.display_name])
     embed = discord.Embed(title="📷 기상 인증 요청", description=(f"{ctx.author.mention} 공듀님, 기상 인증 사진을 올려주세요!\n카메라로 아침 인증샷(책상, 시계 등) 첨부 필수 📸"), color=ctx.author.color)
     embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
     msg = await ctx.send(embed=embed)
-    await db.add_wakeup_pending(user_id, msg.id)
+    await db.add_wakeup_pending(guild_id, user_id, msg.id)
 
 @bot.command(name="통계")
+@metrics.timed("handler", "!통계")
 async def show_stats(ctx):
+    guild_id = str(ctx.guild.id)
     user_id = str(ctx.author.id)
     now = datetime.now(timezone('Asia/Seoul'))
     footer = get_embed_footer(ctx.author, now)
-    exp = await get_user_exp(user_id)
+    exp = await get_user_exp(guild_id, user_id)
     level = get_level_from_exp(exp)
     leveldata = LEVELS[level]
-    stats_month = await db.get_monthly_stats(user_id)
-    stats_week = await db.get_weekly_stats(user_id)
-    total_attendance = len(await db.get_attendance(user_id))
-    total_wakeup = (await db.db_execute(f"SELECT COUNT(*) FROM wakeup WHERE user_id = {db.placeholder}", (user_id,), fetch="one"))[0]
-    total_study_days = (await db.db_execute(f"SELECT COUNT(DISTINCT date) FROM study WHERE user_id = {db.placeholder} AND minutes >= 10", (user_id,), fetch="one"))[0]
-    total_study_minutes = (await db.db_execute(f"SELECT COALESCE(SUM(minutes), 0) FROM study WHERE user_id = {db.placeholder}", (user_id,), fetch="one"))[0]
+    stats = await db.get_user_stats_snapshot(guild_id, user_id)
+    stats_month, stats_week, stats_total = stats["month"], stats["week"], stats["total"]
     embed = discord.Embed(title=f"{ctx.author.display_name}님의 통계 정보", color=ctx.author.color)
     embed.add_field(name="👑 레벨·경험치", value=f"{leveldata['emoji']} Lv.{level} ({exp} Exp)", inline=False)
     embed.add_field(name="📅 이번달 통계", value=(f"출석: {stats_month['attendance']}일\n기상: {stats_month['wakeup']}일\n공부일수: {stats_month['study_days']}일\n공부시간: {stats_month['study_minutes']}분"), inline=True)
     embed.add_field(name="📆 이번주 통계", value=(f"출석: {stats_week['attendance']}일\n기상: {stats_week['wakeup']}일\n공부일수: {stats_week['study_days']}일\n공부시간: {stats_week['study_minutes']}분"), inline=True)
-    embed.add_field(name="🔢 전체 누적 통계", value=(f"총 출석: {total_attendance}회\n총 기상: {total_wakeup}회\n총 공부일수: {total_study_days}일\n총 공부시간: {total_study_minutes}분"), inline=False)
+    embed.add_field(name="🔢 전체 누적 통계", value=(f"총 출석: {stats_total['attendance']}회\n총 기상: {stats_total['wakeup']}회\n총 공부일수: {stats_total['study_days']}일\n총 공부시간: {stats_total['study_minutes']}분"), inline=False)
     embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
     await ctx.send(embed=embed)
 
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [수정] !기록: 전체 출석 기록 대신 한 페이지씩 읽고, 버튼으로 페이지/종류를 넘김
+# - 버튼을 누를 때마다 db.get_history_page로 그 페이지만 조회
+# - 지나온 페이지의 커서를 쌓아 두고 이전 버튼에서 하나씩 꺼냄
+# ====================================================================================
+HISTORY_KINDS = {
+    "attendance": ("🗓️ 출석 날짜", "✅", "아직 출석 기록이 없습니다."),
+    "wakeup": ("🌅 기상 날짜", "☀️", "아직 기상 기록이 없습니다."),
+    "study": ("📚 공부 기록", "📖", "아직 공부 기록이 없습니다."),
+}
+
+def format_history_rows(kind, rows):
+    _, emoji, empty = HISTORY_KINDS[kind]
+    if not rows:
+        return empty
+    if kind == "study":
+        return "\n".join(f"{emoji} {row[0]} — {row[1] or 0}분" for row in rows)
+    return "\n".join(f"{emoji} {row[0]}" for row in rows)
+
+class HistoryPageView(View):
+    def __init__(self, member, streak_text, kind="attendance"):
+        super().__init__(timeout=180)
+        self.member = member
+        self.streak_text = streak_text
+        self.kind = kind
+        self.message = None
+        self._cursors = []       # 지나온 페이지들의 시작 커서
+        self._before = None      # 지금 페이지의 시작 커서 (첫 페이지는 None)
+        self._next_before = None
+        self._total = 0
+
+    async def load(self, before=None):
+        rows, self._next_before = await db.get_history_page(str(self.member.guild.id), self.kind, str(self.member.id), before)
+        self._before = before
+        self.prev_page.disabled = not self._cursors
+        self.next_page.disabled = self._next_before is None
+        page = len(self._cursors) + 1
+        pages = max(1, -(-self._total // db.HISTORY_PAGE_SIZE))
+        title, _, _ = HISTORY_KINDS[self.kind]
+        embed = discord.Embed(title=f"{self.member.display_name}님의 기록 정보", color=self.member.color)
+        embed.add_field(name="🔥 연속 기록", value=self.streak_text, inline=False)
+        embed.add_field(name=f"{title} (총 {self._total}개, {page}/{pages}쪽)", value=format_history_rows(self.kind, rows), inline=False)
+        footer = get_embed_footer(self.member, datetime.now(timezone('Asia/Seoul')))
+        embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
+        return embed
+
+    async def switch(self, kind):
+        self.kind = kind
+        self._cursors = []
+        self._total = await db.count_history(str(self.member.guild.id), kind, str(self.member.id))
+        return await self.load()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.member.id:
+            await interaction.response.send_message("본인의 기록만 넘겨볼 수 있어요!", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="◀ 이전", style=discord.ButtonStyle.secondary, row=0)
+    async def prev_page(self, interaction: discord.Interaction, button: Button):
+        embed = await self.load(self._cursors.pop())
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="다음 ▶", style=discord.ButtonStyle.secondary, row=0)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        self._cursors.append(self._before)
+        embed = await self.load(self._next_before)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="✅ 출석", style=discord.ButtonStyle.primary, row=1)
+    async def show_attendance(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.edit_message(embed=await self.switch("attendance"), view=self)
+
+    @discord.ui.button(label="☀️ 기상", style=discord.ButtonStyle.primary, row=1)
+    async def show_wakeup(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.edit_message(embed=await self.switch("wakeup"), view=self)
+
+    @discord.ui.button(label="📚 공부", style=discord.ButtonStyle.primary, row=1)
+    async def show_study(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.edit_message(embed=await self.switch("study"), view=self)
+
 @bot.command(name="기록")
+@metrics.timed("handler", "!기록")
 async def show_records(ctx):
-    user_id = str(ctx.author.id)
-    now = datetime.now(timezone('Asia/Seoul'))
-    footer = get_embed_footer(ctx.author, now)
-    exp = await get_user_exp(user_id)
-    level = get_level_from_exp(exp)
-    leveldata = LEVELS[level]
-    rows = await db.get_attendance(user_id)
-    attendance_list = "\n".join(f"✅ {row[0]}" for row in rows[:20]) if rows else "아직 출석 기록이 없습니다."
-    if len(rows) > 20: attendance_list += "\n… (이하 생략)"
-    streak_att = await db.get_streak_attendance(user_id)
-    streak_wup = await db.get_streak_wakeup(user_id)
-    streak_std = await db.get_streak_study(user_id)
-    embed = discord.Embed(title=f"{ctx.author.display_name}님의 기록 정보", color=ctx.author.color)
-    embed.add_field(name="🔥 연속 기록", value=(f"연속 출석: {streak_att}일\n연속 기상: {streak_wup}일\n연속 공부: {streak_std}일"), inline=False)
-    embed.add_field(name="🗓️ 출석 날짜 (최근 20개)", value=attendance_list, inline=False)
-    embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
-    await ctx.send(embed=embed)
+    streaks = await db.get_streaks(str(ctx.guild.id), str(ctx.author.id))
+    streak_att, streak_wup, streak_std = streaks["attendance"], streaks["wakeup"], streaks["study"]
+    streak_text = (f"연속 출석: {streak_att['current']}일 (최장 {streak_att['longest']}일)\n"
+                   f"연속 기상: {streak_wup['current']}일 (최장 {streak_wup['longest']}일)\n"
+                   f"연속 공부: {streak_std['current']}일 (최장 {streak_std['longest']}일)")
+    view = HistoryPageView(ctx.author, streak_text)
+    embed = await view.switch("attendance")
+    view.message = await ctx.send(embed=embed, view=view)
 
 @bot.command(name="명령어")
+@metrics.timed("handler", "!명령어")
 async def command_list(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     footer = get_embed_footer(ctx.author, now)
+    config = guild_configs.get(ctx.guild.id)
+
+    def mention(channel_id, fallback):
+        return f"<#{channel_id}>" if channel_id else fallback
+
+    tracked = sorted(guild_configs.tracked_voice_ids(ctx.guild))
     embed = discord.Embed(title="👑 공듀봇명령어 모음", description="각 채널에서 명령어를 입력해보세요!\n아래 채널명 클릭 시 바로 이동됩니다.", color=ctx.author.color)
-    embed.add_field(name=f"🍀 출석 (`!출석`)", value=f"매일 <#{ATTENDANCE_CHANNEL_ID}> 채널에서 출석하고 경험치를 얻으세요.", inline=False)
-    embed.add_field(name=f"🌅 기상 (`!기상`)", value=f"<#{WAKEUP_CHANNEL_ID}> 채널에서 기상 인증 사진을 올려주세요.", inline=False)
+    embed.add_field(name=f"🍀 출석 (`!출석`)", value=f"매일 {mention(config.attendance_channel_id, '출석')} 채널에서 출석하고 경험치를 얻으세요.", inline=False)
+    embed.add_field(name=f"🌅 기상 (`!기상`)", value=f"{mention(config.wakeup_channel_id, '기상')} 채널에서 기상 인증 사진을 올려주세요.", inline=False)
     embed.add_field(name="📊 통계 (`!통계`)", value="나의 월간/주간/전체 통계를 한 번에 확인합니다.", inline=False)
-    embed.add_field(name="📜 기록 (`!기록`)", value="나의 출석 날짜 및 연속 기록을 확인합니다.", inline=False)
-    embed.add_field(name=f"🏠 내정보 (`!내정보`)", value=f"<#{MYINFO_CHANNEL_ID}> 채널에서 나의 레벨, 경험치, 통계를 확인하고 업데이트합니다.", inline=False)
-    embed.add_field(name="🎥 캠스터디 자동 기록", value=f"음성 채널 <#{TRACKED_VOICE_CHANNELS[0]}> 등에 입장 시 공부시간이 자동 기록됩니다.", inline=False)
+    embed.add_field(name="📜 기록 (`!기록`)", value="나의 출석·기상·공부 기록과 연속 기록을 버튼으로 넘겨보며 확인합니다.", inline=False)
+    embed.add_field(name=f"🏠 내정보 (`!내정보`)", value=f"{mention(config.myinfo_channel_id, '내정보')} 채널에서 나의 레벨, 경험치, 통계를 확인하고 업데이트합니다.", inline=False)
+    embed.add_field(name="🎥 캠스터디 자동 기록", value=f"음성 채널 {mention(tracked[0] if tracked else None, TRACKED_VOICE_CHANNELS[0])} 등에 입장 시 공부시간이 자동 기록됩니다.", inline=False)
     embed.set_footer(text=footer["text"], icon_url=footer["icon_url"])
     await ctx.send(embed=embed)
 
 @bot.command(name="내정보")
+@metrics.timed("handler", "!내정보")
 async def my_info(ctx):
     await create_or_update_user_info(ctx.author)
-    await ctx.send(f"{ctx.author.mention}님의 내정보를 <#{MYINFO_CHANNEL_ID}> 채널에 생성 또는 업데이트했어요!", ephemeral=True)
+    channel = guild_configs.channel(ctx.guild, "myinfo")
+    if channel is None:
+        return await ctx.send("❌ 이 서버에는 내정보 채널이 설정되어 있지 않아요. 관리자에게 `/채널설정`을 요청해주세요.")
+    await ctx.send(f"{ctx.author.mention}님의 내정보를 {channel.mention} 채널에 생성 또는 업데이트했어요!", ephemeral=True)
 
 # --- Slash Commands ---
 @bot.tree.command(name="경험치추가", description="지정한 유저에게 원하는 양의 경험치를 지급합니다.")
 @app_commands.describe(user="경험치를 받을 사용자", amount="지급할 경험치 양(정수)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/경험치추가")
 async def slash_add_exp(interaction: discord.Interaction, user: discord.Member, amount: int):
     if amount <= 0: return await interaction.response.send_message("❌ 올바른 양을 입력해주세요 (양수).", ephemeral=True)
     await add_exp_and_check_level(user, amount)
@@ -518,30 +960,34 @@ async def slash_add_exp(interaction: discord.Interaction, user: discord.Member,
 @bot.tree.command(name="경험치제거", description="지정한 유저의 경험치를 원하는 만큼 제거합니다.")
 @app_commands.describe(user="대상 유저", amount="제거할 Exp 양(정수, 0 이상)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/경험치제거")
 async def slash_remove_exp(interaction: discord.Interaction, user: discord.Member, amount: int):
     if amount < 0: return await interaction.response.send_message("❌ 0 이상의 값을 입력해주세요.", ephemeral=True)
-    current = await db.get_exp(str(user.id))
-    removed = min(amount, current)
-    await db.remove_exp(str(user.id), removed)
-    new_total = await db.get_exp(str(user.id))
+    exp_before, new_total = await db.remove_exp(str(interaction.guild.id), str(user.id), amount)
+    removed = exp_before - new_total
     await create_or_update_user_info(user)
+    ranking_refresher.mark_dirty(interaction.guild.id)
     await interaction.response.send_message(f"✅ {user.mention}님에게서 **{removed} Exp**를 제거했습니다. (총 Exp: **{new_total}**)", ephemeral=True)
 
 @bot.tree.command(name="역할경험치추가", description="지정한 역할을 가진 모든 유저에게 원하는 양의 경험치를 지급합니다.")
 @app_commands.describe(role="대상 역할", amount="지급할 경험치 양(정수)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/역할경험치추가")
 async def slash_role_add_exp(interaction: discord.Interaction, role: discord.Role, amount: int):
     if amount <= 0: return await interaction.response.send_message("❌ 올바른 양을 입력해주세요 (양수).", ephemeral=True)
     members = [m for m in role.members if not m.bot]
     if not members: return await interaction.response.send_message("❌ 해당 역할을 가진 사용자가 없습니다.", ephemeral=True)
     await interaction.response.defer(ephemeral=True)
-    for m in members:
-        await add_exp_and_check_level(m, amount)
-    await interaction.followup.send(f"✅ 역할 `{role.name}`을(를) 가진 {len(members)}명에게 각각 {amount} Exp를 지급했습니다.")
+    grants = await grant_exp_to_members(interaction.guild, members, amount)
+    levelups = sum(1 for _, _, new_level in grants if new_level)
+    await interaction.followup.send(f"✅ 역할 `{role.name}`을(를) 가진 {len(grants)}명에게 각각 {amount} Exp를 지급했습니다. (레벨업 {levelups}명)")
+    # 레벨업 알림과 내정보 갱신은 응답을 보낸 뒤 처리
+    await notify_bulk_grants(interaction.guild, grants)
 
 @bot.tree.command(name="추첨", description="온라인 상태인 유저 중 한 명을 추첨해 경험치를 지급합니다.")
 @app_commands.describe(amount="추첨하여 지급할 경험치 양(정수)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/추첨")
 async def slash_raffle(interaction: discord.Interaction, amount: int):
     if amount <= 0: return await interaction.response.send_message("❌ 올바른 양을 입력해주세요 (양수).", ephemeral=True)
     members = [m for m in interaction.guild.members if not m.bot and m.status != discord.Status.offline]
@@ -553,22 +999,124 @@ async def slash_raffle(interaction: discord.Interaction, amount: int):
 @bot.tree.command(name="경험치설정", description="지정한 유저의 경험치를 정확히 설정합니다.")
 @app_commands.describe(user="대상 유저", amount="설정할 Exp 값(정수, 0 이상)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/경험치설정")
 async def slash_set_exp(interaction: discord.Interaction, user: discord.Member, amount: int):
     if amount < 0: return await interaction.response.send_message("❌ 0 이상의 값을 입력해주세요.", ephemeral=True)
-    await db.set_exp(str(user.id), user.display_name, amount)
+    await db.set_exp(str(interaction.guild.id), str(user.id), user.display_name, amount)
     await create_or_update_user_info(user)
+    ranking_refresher.mark_dirty(interaction.guild.id)
     await interaction.response.send_message(f"✅ {user.mention}님의 Exp를 **{amount}**으로 설정했습니다.", ephemeral=True)
 
 @bot.tree.command(name="공부추가", description="관리자가 지정한 유저의 오늘 공부 시간을 수동으로 추가합니다.")
 @app_commands.describe(user="공부 시간을 추가할 사용자", minutes="추가할 공부 시간 (분 단위, 양수)")
 @app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/공부추가")
 async def slash_add_study(interaction: discord.Interaction, user: discord.Member, minutes: int):
     if minutes <= 0: return await interaction.response.send_message("❌ 1분 이상의 양수를 입력해주세요.", ephemeral=True)
-    await db.log_study_time(str(user.id), user.display_name, minutes)
+    guild_id = str(interaction.guild.id)
+    await db.log_study_time(guild_id, str(user.id), user.display_name, minutes)
     await add_exp_and_check_level(user, minutes)
-    total_today = await db.get_today_study_time(str(user.id))
+    total_today = await db.get_today_study_time(guild_id, str(user.id))
     await interaction.response.send_message(f"✅ {user.mention}님의 오늘 공부 시간으로 **{minutes}분**을 추가했습니다.\n⏳ 오늘 누적 공부 시간: **{total_today}분**\n🌹 **{minutes} Exp**를 획득했어요!", ephemeral=True)
 
+@bot.tree.command(name="연속기록재계산", description="이 서버의 출석/기상/공부 기록으로 연속 기록 카운터를 다시 계산합니다.")
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/연속기록재계산")
+async def slash_rebuild_streaks(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await db.rebuild_streaks(str(interaction.guild.id))
+    await interaction.followup.send("✅ 연속 기록 카운터를 이 서버의 전체 기록 기준으로 다시 계산했습니다.")
+
+@bot.tree.command(name="집계재계산", description="이 서버의 출석/기상/공부 기록으로 일별·월별 활동 집계를 다시 계산합니다.")
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/집계재계산")
+async def slash_rebuild_rollups(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await db.rebuild_activity_rollups(str(interaction.guild.id))
+    await interaction.followup.send("✅ 일별·월별 활동 집계를 이 서버의 전체 기록 기준으로 다시 계산했습니다. (경험치 획득량은 그대로 유지)")
+
+@bot.tree.command(name="느린작업", description="쿼리/핸들러/외부 API 호출 중 가장 느린 작업을 보여줍니다.")
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/느린작업")
+async def slash_slowest(interaction: discord.Interaction):
+    if not metrics.enabled:
+        return await interaction.response.send_message("❌ 계측이 꺼져 있습니다. (METRICS_ENABLED=1 또는 METRICS_FILE / METRICS_PORT 설정)", ephemeral=True)
+    rows = metrics.slowest(10)
+    if not rows:
+        return await interaction.response.send_message("아직 기록된 작업이 없습니다.", ephemeral=True)
+    lines = [f"{kind:<11} p95 {p95 * 1000:>7.1f}ms  max {max_s * 1000:>7.1f}ms  avg {mean * 1000:>6.1f}ms  n={count}\n  {name[:90]}"
+             for kind, name, count, mean, p95, max_s in rows]
+    await interaction.response.send_message("🐢 느린 작업 TOP 10 (p95 기준)\n```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+@bot.tree.command(name="봇상태", description="랭킹 캐시 적중률과 내부 큐 상태를 보여줍니다.")
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/봇상태")
+async def slash_bot_status(interaction: discord.Interaction):
+    cache = db.get_ranking_cache(str(interaction.guild_id)).stats()
+    looked_up = cache["hits"] + cache["shared"] + cache["misses"]
+    hit_rate = (cache["hits"] + cache["shared"]) / looked_up * 100 if looked_up else 0.0
+    sections = [
+        (f"출석 랭킹 캐시 (적중률 {hit_rate:.1f}%)", cache),
+        ("메시지 수정 큐", edit_queue.stats()),
+        ("음성 이벤트 처리", voice_dispatcher.stats()),
+        ("시트 전송 대기열", sheet_outbox.stats()),
+        (f"서버 설정 캐시 (서버 {len(bot.guilds)}개, 샤드 {bot.shard_count}개)", guild_configs.stats()),
+    ]
+    lines = []
+    for title, stats in sections:
+        values = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items())
+        lines.append(f"{title}\n  {values}")
+    await interaction.response.send_message("🩺 봇 상태\n```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# [신규] 서버별 채널 설정: guild_config에 저장하고 GuildConfigCache에 바로 반영
+# ====================================================================================
+CHANNEL_SETTING_CHOICES = [
+    app_commands.Choice(name="랭킹", value="ranking"),
+    app_commands.Choice(name="명예의전당 (레벨업 알림)", value="honor"),
+    app_commands.Choice(name="내정보", value="myinfo"),
+    app_commands.Choice(name="출석", value="attendance"),
+    app_commands.Choice(name="기상", value="wakeup"),
+    app_commands.Choice(name="공부기록", value="study_log"),
+    app_commands.Choice(name="캠스터디 (음성 채널)", value="cam_study"),
+]
+
+@bot.tree.command(name="채널설정", description="이 서버에서 봇이 사용할 채널을 지정합니다.")
+@app_commands.describe(kind="용도", channel="사용할 채널 (캠스터디는 음성 채널, 나머지는 텍스트 채널)")
+@app_commands.choices(kind=CHANNEL_SETTING_CHOICES)
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/채널설정")
+async def slash_set_channel(interaction: discord.Interaction, kind: app_commands.Choice[str],
+                            channel: Union[discord.TextChannel, discord.VoiceChannel]):
+    expected = discord.VoiceChannel if kind.value == "cam_study" else discord.TextChannel
+    if not isinstance(channel, expected):
+        kind_name = "음성" if expected is discord.VoiceChannel else "텍스트"
+        return await interaction.response.send_message(f"❌ {kind.name} 채널은 {kind_name} 채널로 지정해주세요.", ephemeral=True)
+    await guild_configs.set(interaction.guild.id, **{f"{kind.value}_channel_id": channel.id})
+    if kind.value == "ranking":
+        # 다른 채널에 있던 랭킹 메시지 대신 새 채널에 다시 만들도록
+        ranking_message_ids.pop(str(interaction.guild.id), None)
+        ranking_refresher.mark_dirty(interaction.guild.id, force=True)
+    await interaction.response.send_message(f"✅ {kind.name} 채널을 {channel.mention}(으)로 설정했습니다.", ephemeral=True)
+
+@bot.tree.command(name="공부채널", description="음성 채널을 공부 시간 자동 기록 대상에 추가하거나 뺍니다.")
+@app_commands.describe(channel="대상 음성 채널")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@metrics.timed("handler", "/공부채널")
+async def slash_toggle_study_voice(interaction: discord.Interaction, channel: discord.VoiceChannel):
+    tracked = set(guild_configs.tracked_voice_ids(interaction.guild))
+    if channel.id in tracked:
+        tracked.discard(channel.id)
+        result = "기록 대상에서 뺐습니다"
+    else:
+        tracked.add(channel.id)
+        result = "기록 대상에 추가했습니다"
+    await guild_configs.set(interaction.guild.id, tracked_voice_channel_ids=",".join(str(i) for i in sorted(tracked)))
+    await interaction.response.send_message(f"✅ {channel.mention}을(를) {result}. (현재 {len(tracked)}개)", ephemeral=True)
+
 if TOKEN:
     bot.run(TOKEN)
 else:
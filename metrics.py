@@ -0,0 +1,182 @@
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 지연시간 계측: 종류(kind)와 이름별 히스토그램을 모아 Prometheus 텍스트 형식으로 내보냄
+# - kind: db_query(쿼리 모양별), handler(이벤트/명령어), discord_api(REST 경로별), sheets
+# - METRICS_ENABLED=1 이거나 METRICS_FILE / METRICS_PORT가 있으면 켜짐
+# - 꺼져 있으면 timed()는 함수를 그대로 돌려주고 db.py/드라이버에도 아무것도 끼우지 않음
+# ====================================================================================
+METRICS_FILE = os.getenv("METRICS_FILE")  # 주기적으로 덮어쓸 텍스트 파일 경로 (node_exporter textfile 등)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 127.0.0.1:포트/metrics 로 제공
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+enabled = os.getenv("METRICS_ENABLED", "0") == "1" or bool(METRICS_FILE) or bool(METRICS_PORT)
+
+# 초 단위 버킷 경계 (마지막은 +Inf)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """버킷 상한으로 어림한 분위수 (+Inf 버킷이면 관측된 최댓값)"""
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+_histograms = {}  # (kind, name) -> _Histogram
+
+def observe(kind, name, seconds):
+    hist = _histograms.get((kind, name))
+    if hist is None:
+        hist = _histograms[(kind, name)] = _Histogram()
+    hist.observe(seconds)
+
+def timed(kind, name=None):
+    """코루틴 함수용 데코레이터. 계측이 꺼져 있으면 원래 함수를 그대로 반환"""
+    def decorator(func):
+        if not enabled:
+            return func
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe(kind, label, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"\b\d+\b")
+_VALUE_GROUPS = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_PLACEHOLDER_LISTS = re.compile(r"(?:%s|\?)(?:\s*,\s*(?:%s|\?))+")
+
+@functools.lru_cache(maxsize=1024)
+def query_shape(query):
+    """같은 모양의 쿼리를 하나로 묶는 라벨 (공백 정리, 숫자 → ?, 여러 행 VALUES / IN 목록 축약)"""
+    shape = _WHITESPACE.sub(" ", query).strip()
+    shape = _NUMBER.sub("?", shape)
+    shape = _VALUE_GROUPS.sub(r"\1, ...", shape)
+    shape = _PLACEHOLDER_LISTS.sub("?, ...", shape)
+    return shape[:160]
+
+def instrument_discord_http(http):
+    """discord.py HTTPClient.request를 감싸서 REST 호출을 경로 템플릿별로 기록"""
+    if not enabled or getattr(http, "_metrics_wrapped", False):
+        return
+    original = http.request
+
+    async def request(route, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await original(route, **kwargs)
+        finally:
+            observe("discord_api", f"{route.method} {route.path}", time.perf_counter() - started)
+
+    http.request = request
+    http._metrics_wrapped = True
+
+def slowest(limit=10, kind=None):
+    """[(kind, name, count, 평균초, p95초, 최대초), ...]를 p95가 큰 순으로"""
+    rows = [
+        (k, name, h.count, h.total / h.count, h.quantile(0.95), h.max)
+        for (k, name), h in list(_histograms.items())
+        if h.count and (kind is None or k == kind)
+    ]
+    rows.sort(key=lambda r: (r[4], r[5]), reverse=True)
+    return rows[:limit]
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def render():
+    """Prometheus 텍스트 노출 형식"""
+    by_kind = {}
+    for (kind, name), hist in sorted(list(_histograms.items())):
+        by_kind.setdefault(kind, []).append((name, hist))
+    lines = []
+    for kind, items in by_kind.items():
+        metric = f"jipsa_{kind}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, hist in items:
+            label = f'name="{_escape(name)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (None,), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f'{metric}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{label}}} {hist.total:.6f}")
+            lines.append(f"{metric}_count{{{label}}} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# 내보내기: 파일은 주기적으로 원자적 교체, 포트는 로컬에서만 열림
+# ====================================================================================
+_export_tasks = []
+_started = False
+
+def _write_file(text):
+    tmp_path = f"{METRICS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, METRICS_FILE)
+
+async def _file_exporter():
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+        try:
+            await asyncio.to_thread(_write_file, render())
+        except Exception as e:
+            logger.error(f"계측 파일 저장 실패: {e}")
+
+async def _serve(port):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    logger.info(f"계측 값 제공 중: http://127.0.0.1:{port}/metrics")
+
+async def start():
+    global _started
+    if not enabled or _started:
+        return
+    _started = True
+    if METRICS_FILE:
+        _export_tasks.append(asyncio.create_task(_file_exporter()))
+    if METRICS_PORT:
+        await _serve(METRICS_PORT)
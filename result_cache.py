@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# ResultCache: 무거운 조회 결과를 키별로 ttl초 동안 재사용
+# - 같은 키를 동시에 요청하면 계산은 한 번만 하고 나머지는 그 결과를 같이 기다림 (single-flight)
+# - invalidate()는 저장된 결과를 지우고, 지우기 전에 시작된 계산 결과는 저장하지 않음
+# ====================================================================================
+class ResultCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}   # key -> (만료 시각, 결과)
+        self._inflight = {}  # key -> Future
+        self._generation = 0
+        # 상태 확인용 카운터
+        self.hits = 0
+        self.shared = 0      # 이미 진행 중인 계산에 합류한 수
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key, compute):
+        """캐시된 결과 또는 compute()의 결과. 반환값은 공유되므로 호출한 쪽에서 수정하지 않아야 함"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        generation = self._generation
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 기다리는 쪽이 없어도 경고가 남지 않도록
+            raise
+        else:
+            future.set_result(value)
+            if generation == self._generation:
+                self._store(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        # 날짜가 들어간 키처럼 다시 쓰이지 않는 항목이 쌓이지 않도록 만료된 것은 정리
+        for stale in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[stale]
+        self._entries[key] = (now + self.ttl, value)
+
+    def invalidate(self):
+        """모든 결과를 버림 (진행 중인 계산은 끝나도 저장되지 않고, 이후 요청은 새로 계산)"""
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "shared": self.shared,
+                "misses": self.misses, "invalidations": self.invalidations}
@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# JobScheduler: 예약 작업을 힙 하나와 백그라운드 작업 하나로 처리
+# - 작업은 (job_type, guild_id, user_id) 키로 하나만 존재 → 다시 예약하면 기존 예약을 대체
+# - scheduled_jobs 테이블에 저장해서 재시작 후에도 이어서 실행 (지난 작업은 바로 실행)
+# ====================================================================================
+class JobScheduler:
+    def __init__(self):
+        self._heap = []   # (run_at, seq, key)
+        self._jobs = {}   # key -> (run_at, seq, payload)
+        self._handlers = {}
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def register(self, job_type, handler):
+        """handler(guild_id, user_id, payload) 코루틴 함수를 job_type에 연결"""
+        self._handlers[job_type] = handler
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        for job_type, guild_id, user_id, run_at, payload in await db.get_scheduled_jobs():
+            self._push((job_type, guild_id, user_id), run_at, json.loads(payload) if payload else None)
+        self._task = asyncio.create_task(self._run())
+
+    def pending(self):
+        return len(self._jobs)
+
+    async def schedule(self, job_type, guild_id, user_id, delay, payload=None):
+        """delay초 뒤에 실행. 같은 키의 예약이 있으면 새 시각으로 바꿈"""
+        run_at = time.time() + delay
+        await db.upsert_scheduled_job(job_type, guild_id, user_id, run_at, json.dumps(payload) if payload is not None else None)
+        self._push((job_type, guild_id, user_id), run_at, payload)
+
+    async def cancel(self, job_type, guild_id, user_id):
+        if self._jobs.pop((job_type, guild_id, user_id), None) is not None:
+            self._wake.set()
+        await db.delete_scheduled_job(job_type, guild_id, user_id)
+
+    def _push(self, key, run_at, payload):
+        seq = next(self._seq)
+        self._jobs[key] = (run_at, seq, payload)
+        heapq.heappush(self._heap, (run_at, seq, key))
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            # 취소/재예약으로 무효가 된 항목은 꺼낼 때 버림
+            while self._heap and self._jobs.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            run_at, seq, key = self._heap[0]
+            delay = run_at - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            _, _, payload = self._jobs.pop(key)
+            asyncio.create_task(self._execute(key, run_at, payload))
+
+    async def _execute(self, key, run_at, payload):
+        job_type, guild_id, user_id = key
+        handler = self._handlers.get(job_type)
+        try:
+            if handler is None:
+                logger.warning(f"등록되지 않은 예약 작업 종류: {job_type}")
+            else:
+                await handler(guild_id, user_id, payload)
+        except Exception as e:
+            logger.error(f"예약 작업 {job_type}({user_id}) 실행 중 오류: {e}")
+        finally:
+            # 실행 중에 같은 키로 다시 예약됐다면 그 예약은 남겨 둠
+            await db.delete_scheduled_job(job_type, guild_id, user_id, run_at)
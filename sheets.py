@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import aiohttp
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================================
+# ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
+# SheetOutbox: 구글 시트 기록을 바로 보내지 않고 모아서 전송
+# - append()는 메모리에 넣기만 하고 즉시 반환 (명령어 응답이 시트 때문에 느려지지 않음)
+# - 백그라운드 작업이 sheet_outbox 테이블에 먼저 저장한 뒤, 시트별로 묶어서 전송
+# - 전송에 실패하면 지수 백오프로 재시도 (기다리는 동안 들어온 행도 바로 spool에 저장)
+# - 종료할 때 close()가 남은 행을 저장하므로 봇이 재시작돼도 이어서 전송
+# - 기본은 기존 웹훅 형태 {"sheet": 시트이름, "data": [...]}로 한 행씩 전송
+#   batched=True면 {"sheet": 시트이름, "rows": [[...], [...]]}로 묶어서 전송 (웹훅이 지원할 때만)
+# - Apps Script는 오류가 나도 200을 돌려주므로 응답 본문까지 확인한 뒤에 spool에서 지움
+# ====================================================================================
+def _response_ok(text):
+    """웹훅 응답 본문이 성공인지 (JSON이면 ok/status/result/error 값, 아니면 오류 문구가 없는지)"""
+    try:
+        body = json.loads(text)
+    except ValueError:
+        lowered = text.strip().lower()
+        # Apps Script 예외는 HTML 오류 페이지로 돌아옴
+        return not (lowered.startswith("<") or "error" in lowered or "exception" in lowered)
+    if not isinstance(body, dict):
+        return True
+    if body.get("ok") is False or body.get("error"):
+        return False
+    return str(body.get("status", body.get("result", ""))).lower() not in ("error", "fail", "failed")
+
+class SheetOutbox:
+    def __init__(self, webhook_url, batch_size=20, flush_interval=5.0, max_backoff=300.0, timeout=10.0, batched=False):
+        self.webhook_url = webhook_url
+        self.batched = batched
+        self.batch_size = batch_size if batched else 1
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._pending = []  # 아직 spool 테이블에 저장되지 않은 (sheet, row)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._session = None
+        self._backoff = 0.0
+        # 상태 확인용 카운터
+        self.sent_rows = 0
+        self.sent_requests = 0
+        self.failed_requests = 0
+        self.spooled_rows = 0  # 마지막 확인 시점에 spool에 남아 있던 행 수
+        self.oldest_created_at = None  # spool에서 가장 오래 기다린 행의 저장 시각
+        self.last_success_at = None
+
+    def append(self, sheet_name, row):
+        """시트에 보낼 행 추가 (기다리지 않음)"""
+        self._pending.append((sheet_name, row))
+        self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            self._wake.set()  # 재시작 전에 남아 있던 행부터 전송
+
+    async def close(self):
+        """백그라운드 작업을 멈추고 아직 저장되지 않은 행을 spool에 저장 (봇 종료 시 호출)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self._persist_pending()
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        lag = time.time() - self.oldest_created_at if self.oldest_created_at else 0.0
+        return {
+            "pending_rows": len(self._pending) + self.spooled_rows,
+            "sent_rows": self.sent_rows,
+            "sent_requests": self.sent_requests,
+            "failed_requests": self.failed_requests,
+            "lag_seconds": round(lag, 1),
+            "last_success_at": self.last_success_at,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._persist_pending()
+                ok = await self.flush()
+            except Exception as e:
+                logger.error(f"시트 전송 대기열 처리 중 오류: {e}")
+                ok = False
+            if ok:
+                self._backoff = 0.0
+            else:
+                self._backoff = min(self.max_backoff, max(self.flush_interval, self._backoff * 2))
+                await self._wait_backoff(self._backoff * random.uniform(0.8, 1.2))
+
+    async def _wait_backoff(self, delay):
+        """전송만 delay초 미루고, 그 사이 append된 행은 그때그때 spool에 저장"""
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            self._wake.clear()
+            try:
+                await self._persist_pending()
+            except Exception as e:
+                logger.error(f"시트 전송 대기열 저장 중 오류: {e}")
+        self._wake.set()  # 기다림이 끝나면 바로 다시 전송
+
+    async def _persist_pending(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await db.spool_sheet_rows([(sheet, json.dumps(row, ensure_ascii=False)) for sheet, row in rows])
+        except BaseException:
+            self._pending[:0] = rows  # 저장 실패(또는 종료로 취소) 시 다음 번에 다시 시도
+            raise
+
+    async def flush(self):
+        """spool에 쌓인 행을 시트별로 묶어 전송. 전부 보냈으면 True"""
+        while True:
+            spooled = await db.get_spooled_sheet_rows(self.batch_size * 10)
+            if not spooled:
+                self.spooled_rows, self.oldest_created_at = 0, None
+                return True
+            self.spooled_rows = await db.count_spooled_sheet_rows()
+            self.oldest_created_at = spooled[0][3]
+            batches = {}
+            for row_id, sheet, payload, _ in spooled:
+                batches.setdefault(sheet, []).append((row_id, json.loads(payload)))
+            for sheet, items in batches.items():
+                for start in range(0, len(items), self.batch_size):
+                    chunk = items[start:start + self.batch_size]
+                    if not await self._post(sheet, [row for _, row in chunk]):
+                        return False
+                    await db.delete_spooled_sheet_rows([row_id for row_id, _ in chunk])
+                    self.sent_rows += len(chunk)
+                    self.last_success_at = time.time()
+            logger.info(f"구글 시트 전송 완료: 누적 {self.sent_rows}행 (남은 행 약 {max(0, self.spooled_rows - len(spooled))}개)")
+
+    @metrics.timed("sheets", "post")
+    async def _post(self, sheet_name, rows):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        payload = {"sheet": sheet_name, "rows": rows} if self.batched else {"sheet": sheet_name, "data": rows[0]}
+        try:
+            async with self._session.post(self.webhook_url, json=payload) as resp:
+                if resp.status != 200:
+                    logger.warning(f"Google Sheet API 비정상 응답: 상태코드 {resp.status}")
+                    self.failed_requests += 1
+                    return False
+                text = await resp.text()
+                if not _response_ok(text):
+                    logger.warning(f"Google Sheet API 오류 응답: {text[:200]}")
+                    self.failed_requests += 1
+                    return False
+        except Exception as e:
+            logger.error(f"Google Sheet API 요청 실패: {str(e)}")
+            self.failed_requests += 1
+            return False
+        self.sent_requests += 1
+        return True